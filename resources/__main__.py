@@ -6,19 +6,15 @@ Where actions can be any list of actions to take.
 
 """
 
-import difflib
-import json
-import os
-import shutil
-import sys
-import zipfile
+import time
 from argparse import ArgumentParser
-from typing import Optional
+from typing import Optional, Callable, List
 
 from mcresources import ResourceManager, utils
 
 import advancements
 import assets
+import build_cache
 import constants
 import data
 import tags
@@ -29,6 +25,8 @@ import generate_trees
 import recipes
 import validate_assets
 import world_gen
+import zip_resources
+from resource_managers import ValidatingResourceManager, BufferedResourceManager, generate_isolated_all
 
 BOOK_LANGUAGES = ('en_us', 'ja_jp', 'ko_kr', 'pt_br', 'ru_ru', 'uk_ua', 'zh_cn', 'zh_tw', 'zh_hk')
 MOD_LANGUAGES = ('en_us', 'es_es', 'de_de', 'ja_jp', 'ko_kr', 'pl_pl', 'pt_br', 'ru_ru', 'tr_tr', 'uk_ua', 'zh_cn', 'zh_tw', 'zh_hk')
@@ -47,6 +45,7 @@ def main():
         'worldgen',  # only world gen data (excluding tags)
         'advancements',  # only advancements.py (which excludes recipe advancements)
         'book',  # generate the book
+        'watch',  # generate the book, then re-generate it whenever it or a translation changes
         'trees',  # generate tree NBT structures from templates
         'format_lang',  # format language files
         'textures',  # generate textures
@@ -55,9 +54,15 @@ def main():
     parser.add_argument('--translate', type=str, default='en_us', help='Runs the book translation using a single provided language')
     parser.add_argument('--translate-all', action='store_true', dest='translate_all', help='Runs the book against all provided translations')
     parser.add_argument('--reverse-translate', action='store_true', dest='reverse_translate', help='Reverses a book translation, creating a <lang>.json from translated book files')
+    parser.add_argument('--category', type=str, action='append', dest='categories', default=None, help='Only generates the given category of the book, can be used multiple times. Used for \'book\'')
     parser.add_argument('--local', type=str, default=None, help='Points to a local minecraft instance. Used for \'book\', to generate a hot reloadable book, and used for \'clean\', to clean said instance\'s book')
     parser.add_argument('--hotswap', action='store_true', dest='hotswap', help='Causes resource generation to also generate to --hotswap-dir')
     parser.add_argument('--hotswap-dir', type=str, default='./out/production/resources', help='Used for \'--hotswap\'')
+    parser.add_argument('--cache', action='store_true', dest='cache', help='Skips resource generators which are unchanged since the last run, using a build cache stored in .cache/resources')
+    parser.add_argument('--zip-level', type=int, default=None, dest='zip_level', help='Deflates entries for \'zip\' with the given compression level, from 0 - 9. By default, entries are stored uncompressed')
+    parser.add_argument('--zip-incremental', action='store_true', dest='zip_incremental', help='Causes \'zip\' to only write entries which have changed since it was last run')
+    parser.add_argument('--trees-grid', action='store_true', dest='trees_grid', help='Uses a NumPy voxel grid to find log and leaf paths for \'trees\'')
+    parser.add_argument('--jobs', type=int, default=1, help='Runs resource generation with each generator in a separate process, and texture, tree, book and lang generation, using up to N processes')
 
     args = parser.parse_args()
     hotswap = args.hotswap_dir if args.hotswap else None
@@ -66,44 +71,43 @@ def main():
         if action == 'clean':
             clean(args.local)
         elif action == 'validate':
-            validate_resources()
+            validate_resources(args.jobs)
         elif action == 'validate_assets':
             validate_assets.main()
         elif action == 'all':
-            resources(hotswap=hotswap, do_assets=True, do_data=True, do_recipes=True, do_worldgen=True, do_advancements=True)
-            format_lang.main(False, 'minecraft', MOD_LANGUAGES)  # format_lang
-            format_lang.main(False, 'tfc', MOD_LANGUAGES)
-            for lang in BOOK_LANGUAGES:  # Translate all
-                generate_book.main(lang, args.local, False)
+            resources(hotswap=hotswap, do_assets=True, do_data=True, do_recipes=True, do_worldgen=True, do_advancements=True, jobs=args.jobs, use_cache=args.cache)
+            format_lang.main(False, ('minecraft', 'tfc'), MOD_LANGUAGES, args.jobs)  # format_lang
+            generate_book.main_all(BOOK_LANGUAGES, args.local, jobs=args.jobs)  # Translate all
         elif action == 'assets':
-            resources(hotswap=hotswap, do_assets=True)
+            resources(hotswap=hotswap, do_assets=True, jobs=args.jobs, use_cache=args.cache)
         elif action == 'data':
-            resources(hotswap=hotswap, do_data=True)
+            resources(hotswap=hotswap, do_data=True, jobs=args.jobs, use_cache=args.cache)
         elif action == 'recipes':
-            resources(hotswap=hotswap, do_recipes=True)
+            resources(hotswap=hotswap, do_recipes=True, jobs=args.jobs, use_cache=args.cache)
         elif action == 'worldgen':
-            resources(hotswap=hotswap, do_worldgen=True)
+            resources(hotswap=hotswap, do_worldgen=True, jobs=args.jobs, use_cache=args.cache)
         elif action == 'advancements':
-            resources(hotswap=hotswap, do_advancements=True)
+            resources(hotswap=hotswap, do_advancements=True, jobs=args.jobs, use_cache=args.cache)
         elif action == 'textures':
-            generate_textures.main()
+            generate_textures.main(args.jobs)
         elif action == 'book':
             if args.translate_all:
-                for lang in BOOK_LANGUAGES:
-                    generate_book.main(lang, args.local, validate=False, reverse_translate=args.reverse_translate)
+                generate_book.main_all(BOOK_LANGUAGES, args.local, args.reverse_translate, args.jobs, args.categories)
             else:
-                generate_book.main(args.translate, args.local, validate=False, reverse_translate=args.reverse_translate)
+                generate_book.main(args.translate, args.local, validate=False, reverse_translate=args.reverse_translate, categories=args.categories)
+        elif action == 'watch':
+            generate_book.watch(BOOK_LANGUAGES if args.translate_all else (args.translate,), args.local, args.categories)
         elif action == 'trees':
-            generate_trees.main()
+            generate_trees.main(args.jobs, args.trees_grid)
         elif action == 'format_lang':
-            format_lang.main(False, 'minecraft', MOD_LANGUAGES)
-            format_lang.main(False, 'tfc', MOD_LANGUAGES)
+            format_lang.main(False, ('minecraft', 'tfc'), MOD_LANGUAGES, args.jobs)
         elif action == 'zip':
-            zip_resources()
+            zip_resources.main(args.zip_level, args.zip_incremental)
 
 def clean(local: Optional[str]):
     """ Cleans all generated resources files """
     clean_at('./src/main/resources')
+    build_cache.clean()
     if local:
         clean_at(local)
 
@@ -118,87 +122,62 @@ def clean_at(location: str):
     print('Clean Aborted')
 
 
-def validate_resources():
+def validate_resources(jobs: int = 1):
     """ Validates all resources are unchanged. """
     rm = ValidatingResourceManager('tfc', './src/main/resources')
-    resources_at(rm, True, True, True, True, True)
+    resources_at(rm, True, True, True, True, True, jobs)
     error = rm.error_files != 0
 
     for lang in BOOK_LANGUAGES:
         try:
             generate_book.main(lang, None, True, rm)
-            error |= rm.error_files != 0
         except AssertionError as e:
             print(e)
             error = True
+        rm.validate_buffered()
+        error |= rm.error_files != 0
 
-    for lang in MOD_LANGUAGES:
-        try:
-            format_lang.main(True, 'minecraft', (lang,))
-            format_lang.main(True, 'tfc', (lang,))
-        except AssertionError as e:
-            print(e)
-            error = True
+    try:
+        format_lang.main(True, ('minecraft', 'tfc'), MOD_LANGUAGES, jobs)
+    except AssertionError as e:
+        print(e)
+        error = True
 
     assert not error, 'Validation Errors Were Present'
 
-def zip_resources():
-    asset_count = zip_asset_type('assets')
-    data_count = zip_asset_type('data')
-
-    rescue_folder('META-INF')
-    rescue_folder('data/tfc/patchouli_books')
-    rescue_asset('tfc.mixins.json')
-    rescue_asset('assets_zipped.zip')
-    rescue_asset('data_zipped.zip')
-
-    print(f'Zipped {asset_count} asset files, {data_count} data files.')
-
-def zip_asset_type(asset_type: str):
-    count = 0
-    with zipfile.ZipFile(f'./src/main/resources/{asset_type}_zipped.zip', 'w') as zf:
-        for dirname, subdirs, files in os.walk('./src/main/resources'):
-            if asset_type in dirname:
-                arcname = dirname.replace('./src/main/resources\\', '')
-                zf.write(dirname, arcname=arcname)
-                for fn in files:
-                    fn_file_name = os.path.join(dirname, fn)
-                    fn_arcname = fn_file_name.replace('./src/main/resources\\', '')
-                    zf.write(fn_file_name, arcname=fn_arcname)
-                    count += 1
-        zf.write('./src/main/resources/pack.mcmeta', arcname='pack.mcmeta')
-    return count
-
-def rescue_asset(path: str):
-    shutil.copy('./src/main/resources/%s' % path, './out/production/resources/%s' % path)
-
-def rescue_folder(path: str):
-    shutil.copytree('./src/main/resources/%s' % path, './out/production/resources/%s' % path, dirs_exist_ok=True)
-
-
-def resources(hotswap: str = None, do_assets: bool = False, do_data: bool = False, do_recipes: bool = False, do_worldgen: bool = False, do_advancements: bool = False):
+def resources(hotswap: str = None, do_assets: bool = False, do_data: bool = False, do_recipes: bool = False, do_worldgen: bool = False, do_advancements: bool = False, jobs: int = 1, use_cache: bool = False):
     """ Generates resource files, or a subset of them """
-    resources_at(ResourceManager('tfc', resource_dir='./src/main/resources'), do_assets, do_data, do_recipes, do_worldgen, do_advancements)
-    if hotswap:
-        resources_at(ResourceManager('tfc', resource_dir=hotswap), do_assets, do_data, do_recipes, do_worldgen, do_advancements)
+    start = time.perf_counter()
+    # Generate once, and write to both the resource and hotswap directories
+    rm = BufferedResourceManager('tfc', resource_dir='./src/main/resources', mirror_dirs=(hotswap,) if hotswap else ())
+    resources_at(rm, do_assets, do_data, do_recipes, do_worldgen, do_advancements, jobs, build_cache.BuildCache((rm.resource_dir, *rm.mirror_dirs)) if use_cache else None)
+    if use_cache:
+        print('Generated resources in %.2fs' % (time.perf_counter() - start))
 
 
-def resources_at(rm: ResourceManager, do_assets: bool, do_data: bool, do_recipes: bool, do_worldgen: bool, do_advancements: bool):
+def resources_at(rm: ResourceManager, do_assets: bool, do_data: bool, do_recipes: bool, do_worldgen: bool, do_advancements: bool, jobs: int = 1, cache: build_cache.BuildCache | None = None):
     # do simple lang keys first, because it's ordered intentionally
     rm.lang(constants.DEFAULT_LANG)
 
     # generic assets / data
+    generators: List[Callable[[ResourceManager], None]] = []
     if do_assets:
-        assets.generate(rm)
+        generators.append(assets.generate)
     if do_data:
-        data.generate(rm)
-        tags.generate(rm)
+        generators.append(data.generate)
+        generators.append(tags.generate)
     if do_recipes:
-        recipes.generate(rm)
+        generators.append(recipes.generate)
     if do_worldgen:
-        world_gen.generate(rm)
+        generators.append(world_gen.generate)
     if do_advancements:
-        advancements.generate(rm)
+        generators.append(advancements.generate)
+
+    if jobs > 1 or cache is not None:
+        generate_isolated_all(rm, generators, jobs, cache)
+    else:
+        for generate in generators:
+            generate(rm)
 
     if all((do_assets, do_data, do_worldgen, do_recipes, do_advancements)):
         # Only generate this when generating all, as it's shared
@@ -206,37 +185,17 @@ def resources_at(rm: ResourceManager, do_assets: bool, do_data: bool, do_recipes
 
         # Separate generation for vanilla override lang
         vanilla_rm = ResourceManager('minecraft', resource_dir=rm.resource_dir)
+        if isinstance(rm, BufferedResourceManager):
+            vanilla_rm.write = rm.write  # Buffer this as well, so it is also written to any mirror directories
         vanilla_rm.lang(constants.VANILLA_OVERRIDE_LANG)
         vanilla_rm.flush()
 
-    print('New = %d, Modified = %d, Unchanged = %d, Errors = %d' % (rm.new_files, rm.modified_files, rm.unchanged_files, rm.error_files))
+    if isinstance(rm, BufferedResourceManager):
+        rm.write_buffered()
+    elif isinstance(rm, ValidatingResourceManager):
+        rm.validate_buffered()
 
-
-class ValidatingResourceManager(ResourceManager):
-
-    def __init__(self, domain: str, resource_dir):
-        super(ValidatingResourceManager, self).__init__(domain, resource_dir)
-        self.validation_error = False
-
-    def write(self, path_parts, data_to_write):
-        data_to_write = utils.del_none({'__comment__': 'This file was automatically created by mcresources', **data_to_write})
-        path = os.path.join(*path_parts) + '.json'
-        try:
-            if not os.path.isfile(path):
-                print('Error: resource generation created new file \'%s\'' % path, file=sys.stderr)
-                self.error_files += 1
-                return
-            with open(path, 'r', encoding='utf-8') as file:
-                old_data = json.load(file)
-            if old_data != data_to_write:
-                old_text = json.dumps(old_data, indent=self.indent)
-                text = json.dumps(data_to_write, indent=self.indent)
-                diff = '\n'.join(difflib.unified_diff(old_text.split('\n'), text.split('\n'), 'old', 'new', n=1))
-                print('Error: resource generation modified file \'%s\' Diff:\n%s\n' % (path, diff), file=sys.stderr)
-                self.error_files += 1
-        except Exception as e:
-            self.on_error(path, e)
-            self.error_files += 1
+    print('New = %d, Modified = %d, Unchanged = %d, Errors = %d' % (rm.new_files, rm.modified_files, rm.unchanged_files, rm.error_files))
 
 
 if __name__ == '__main__':
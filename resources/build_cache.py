@@ -0,0 +1,122 @@
+"""
+A build cache for resource generation, stored under `.cache/resources`
+
+Each generator is keyed by a fingerprint of its source, the source of any other local modules it uses, `constants.py`, and mcresources.
+When a generator is re-run with a matching fingerprint, and all the files it previously generated still exist, it is skipped entirely, and the lang and tag entries it buffered are restored from the cache instead.
+
+"""
+
+import hashlib
+import os
+import pickle
+import sys
+import time
+from types import ModuleType
+from typing import Any, Callable, NamedTuple, List, Set, Sequence, Optional
+
+import mcresources
+
+import constants
+
+CACHE_DIR = './.cache/resources'
+RESOURCES_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class CacheEntry(NamedTuple):
+    fingerprint: str
+    files: List[str]  # All files written by the generator, relative to the resource directory
+    result: Any  # The result of running the generator, to be restored on a cache hit
+    elapsed: float  # The time taken to run the generator, in seconds
+
+
+class BuildCache:
+
+    def __init__(self, resource_dirs: Sequence[Sequence[str]]):
+        """ :param resource_dirs: The resource directory, followed by any directories it is mirrored to. Generated files must exist in all of them. """
+        self.roots = [os.path.join(*resource_dir) for resource_dir in resource_dirs]
+        self.cache_dir = os.path.join(CACHE_DIR, hashlib.sha1('|'.join(map(os.path.abspath, self.roots)).encode('utf-8')).hexdigest()[:12])
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, generate: Callable) -> Optional[CacheEntry]:
+        """ Returns the cache entry for a generator, if it is still valid, otherwise `None` """
+        start = time.perf_counter()
+        path = self.path_of(generate)
+        entry = None
+        if os.path.isfile(path):
+            try:
+                with open(path, 'rb') as f:
+                    entry = pickle.load(f)
+            except Exception as e:
+                print('Failed to read build cache at %s: %s' % (path, e))
+
+        if entry is None or entry.fingerprint != fingerprint(generate) or not all(os.path.isfile(os.path.join(root, f)) for root in self.roots for f in entry.files):
+            self.misses += 1
+            print('Build cache miss for %s' % name_of(generate))
+            return None
+
+        self.hits += 1
+        print('Build cache hit for %s, skipped %d files: %.2fs cold, %.2fs warm' % (name_of(generate), len(entry.files), entry.elapsed, time.perf_counter() - start))
+        return entry
+
+    def save(self, generate: Callable, files: List[str], result: Any, elapsed: float):
+        """ :param files: The files written by the generator, in the resource directory """
+        files = [os.path.relpath(f, self.roots[0]) for f in dict.fromkeys(files)]
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.path_of(generate), 'wb') as f:
+            pickle.dump(CacheEntry(fingerprint(generate), files, result, elapsed), f)
+
+    def path_of(self, generate: Callable) -> str:
+        return os.path.join(self.cache_dir, name_of(generate) + '.pickle')
+
+
+def clean():
+    """ Removes all build cache entries """
+    if os.path.isdir(CACHE_DIR):
+        for dirpath, _, files in os.walk(CACHE_DIR, topdown=False):
+            for fn in files:
+                os.remove(os.path.join(dirpath, fn))
+            os.rmdir(dirpath)
+
+
+def name_of(generate: Callable) -> str:
+    return '%s.%s' % (generate.__module__, generate.__qualname__)
+
+
+def fingerprint(generate: Callable) -> str:
+    """ A hash of all source files that can affect the output of a generator """
+    digest = hashlib.sha256()
+    digest.update(name_of(generate).encode('utf-8'))
+    for path in sorted(source_files(sys.modules[generate.__module__]) | {constants.__file__} | mcresources_files()):
+        with open(path, 'rb') as f:
+            digest.update(os.path.basename(path).encode('utf-8'))
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def source_files(module: ModuleType, seen: Set[str] = None) -> Set[str]:
+    """ The source file of a local module, along with the source files of any local modules it uses, recursively """
+    if seen is None:
+        seen = set()
+    path = os.path.abspath(module.__file__)
+    if path in seen:
+        return seen
+    seen.add(path)
+    for value in vars(module).values():
+        if isinstance(value, ModuleType):
+            dependency = value
+        else:
+            dependency = sys.modules.get(getattr(value, '__module__', None) or '')
+        if dependency is not None and is_local(dependency):
+            source_files(dependency, seen)
+    return seen
+
+
+def mcresources_files() -> Set[str]:
+    root = os.path.dirname(mcresources.__file__)
+    return {os.path.join(root, fn) for fn in os.listdir(root) if fn.endswith('.py')}
+
+
+def is_local(module: ModuleType) -> bool:
+    path = getattr(module, '__file__', None)
+    return path is not None and os.path.dirname(os.path.abspath(path)) == RESOURCES_DIR
@@ -1,14 +1,57 @@
 import difflib
 import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Dict, List, NamedTuple, Optional, Sequence
 
-from typing import Tuple
+import json_loader
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def main(validate: bool, namespace: str, langs: Tuple[str, ...]):
-    en_us = load(namespace, 'en_us')
-    for lang in langs:
-        if lang != 'en_us':
-            format_lang(namespace, en_us, lang, validate)
+
+class LangResult(NamedTuple):
+    namespace: str
+    lang: str
+    translated: int
+    total: int
+    changed: bool  # If the formatted file differs from the existing one
+    error: Optional[str]  # The validation error, if the file was changed when validating
+
+
+def main(validate: bool, namespaces: Sequence[str], langs: Tuple[str, ...], jobs: int = 1):
+    """ Formats, or validates, all languages in each namespace, loading each en_us only once """
+    en_us = {namespace: load(namespace, 'en_us') for namespace in namespaces}
+    tasks = [(namespace, lang) for namespace in namespaces for lang in langs if lang != 'en_us']
+
+    def run(task: Tuple[str, str]) -> LangResult:
+        namespace, lang = task
+        return format_lang(namespace, en_us[namespace], lang, validate)
+
+    if jobs > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(run, tasks))
+    else:
+        results = list(map(run, tasks))
+
+    print_summary(namespaces, results, validate)
+    errors = [result.error for result in results if result.error is not None]
+    assert not errors, '\n\n'.join(errors)
+
+
+def print_summary(namespaces: Sequence[str], results: List[LangResult], validate: bool):
+    """ Prints the translation progress as a table, with one row per language and one column per namespace """
+    rows: Dict[str, Dict[str, LangResult]] = {}
+    for result in results:
+        rows.setdefault(result.lang, {})[result.namespace] = result
+
+    print('Translation progress:')
+    print('  %-6s %s Status' % ('Lang', ' '.join('%-22s' % namespace for namespace in namespaces)))
+    for lang, row in rows.items():
+        columns = ' '.join('%-22s' % (progress(row[namespace]) if namespace in row else '-') for namespace in namespaces)
+        changed = any(r.changed for r in row.values())
+        print('  %-6s %s %s' % (lang, columns, ('invalid' if validate else 'updated') if changed else 'ok'))
 
 
 def update(namespace: str, langs: Tuple[str, ...]):
@@ -27,17 +70,21 @@ def update(namespace: str, langs: Tuple[str, ...]):
             # Strip these keys from en_us, so they don't show up in translations
             for k in updated_keys:
                 del en_us[k]
-            for lang in langs:
-                if lang != 'en_us':
-                    format_lang(namespace, en_us, lang, False)
+            results = [format_lang(namespace, en_us, lang, False) for lang in langs if lang != 'en_us']
+            print_summary((namespace,), results, False)
     else:
         print('No differences found')
 
 
-def format_lang(namespace: str, en_us, lang: str, validate: bool):
-    lang_data = load(namespace, lang)
-    lang_comments = {k: v for k, v in lang_data.items() if '__comment' in k and v != 'This file was automatically created by mcresources'}
-    lang_data = {k: v for k, v in lang_data.items() if '__comment' not in k}
+def progress(result: LangResult) -> str:
+    return '%d / %d (%.1f%%)' % (result.translated, result.total, 100 * result.translated / result.total)
+
+
+def format_lang(namespace: str, en_us, lang: str, validate: bool) -> LangResult:
+    raw = load_bytes(namespace, lang)
+    old_lang_data = json_loader.decode(raw)
+    lang_comments = {k: v for k, v in old_lang_data.items() if '__comment' in k and v != 'This file was automatically created by mcresources'}
+    lang_data = {k: v for k, v in old_lang_data.items() if '__comment' not in k}
 
     formatted_lang_data = {}
     for k, v in lang_comments.items():
@@ -61,13 +108,17 @@ def format_lang(namespace: str, en_us, lang: str, validate: bool):
             if k not in en_us:
                 formatted_lang_data[k] = v
 
-    print('Translation progress for %s (%s): %d / %d (%.1f%%)' % (lang, namespace, translated, len(en_us), 100 * translated / len(en_us)))
-    save(namespace, lang, formatted_lang_data, validate)
+    changed, error = save(namespace, lang, raw, old_lang_data, formatted_lang_data, validate)
+    return LangResult(namespace, lang, translated, len(en_us), changed, error)
 
 
 def load(namespace: str, lang: str):
-    with open('./src/main/resources/assets/%s/lang/%s.json' % (namespace, lang), 'r', encoding='utf-8') as f:
-        return json.load(f)
+    return json_loader.decode(load_bytes(namespace, lang))
+
+
+def load_bytes(namespace: str, lang: str) -> bytes:
+    with open('./src/main/resources/assets/%s/lang/%s.json' % (namespace, lang), 'rb') as f:
+        return f.read()
 
 
 def load_old(namespace: str, lang: str):
@@ -79,11 +130,25 @@ def load_old(namespace: str, lang: str):
         return json.load(f)
 
 
-def save(namespace: str, lang: str, lang_data, validate: bool):
+def save(namespace: str, lang: str, old_raw: bytes, old_lang_data, lang_data, validate: bool) -> Tuple[bool, Optional[str]]:
+    """
+    Compares the formatted data against the existing file, by its serialized bytes, and writes it if it is changed.
+    When validating, returns an error with a diff only if the data is different, as the bytes may differ just by formatting.
+    """
+    raw = encode(lang_data)
+    if raw == old_raw:
+        return False, None
     if validate:
-        with open('./src/main/resources/assets/%s/lang/%s.json' % (namespace, lang), 'r', encoding='utf-8') as f:
-            old_lang_data = json.load(f)
-            assert old_lang_data == lang_data, 'Validation error in mod localization for %s:\n\n=== Diff (expected vs. actual) ===\n\n%s' % (lang, '\n'.join(difflib.unified_diff(json.dumps(lang_data, ensure_ascii=False, indent=2).split('\n'), json.dumps(old_lang_data, ensure_ascii=False, indent=2).split('\n'))))
-    else:
-        with open('./src/main/resources/assets/%s/lang/%s.json' % (namespace, lang), 'w', encoding='utf-8') as f:
-            json.dump(lang_data, f, ensure_ascii=False, indent=2)
+        if old_lang_data == lang_data:
+            return False, None
+        return True, 'Validation error in mod localization for %s (%s):\n\n=== Diff (expected vs. actual) ===\n\n%s' % (lang, namespace, '\n'.join(difflib.unified_diff(raw.decode('utf-8').split('\n'), json.dumps(old_lang_data, ensure_ascii=False, indent=2).split('\n'))))
+    with open('./src/main/resources/assets/%s/lang/%s.json' % (namespace, lang), 'wb') as f:
+        f.write(raw)
+    return True, None
+
+
+def encode(lang_data) -> bytes:
+    """ Serializes a lang file. `orjson` with two space indents produces the same output as `json.dumps(..., ensure_ascii=False, indent=2)`, but much faster """
+    if orjson is not None:
+        return orjson.dumps(lang_data, option=orjson.OPT_INDENT_2)
+    return json.dumps(lang_data, ensure_ascii=False, indent=2).encode('utf-8')
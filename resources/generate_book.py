@@ -69,8 +69,18 @@ In addition, here's some useful things for dev work, and also making standardize
 
 """
 
+import contextlib
+import hashlib
+import importlib
+import io
+import os
+import sys
+import time
+import traceback
 from argparse import ArgumentParser
-from typing import Optional
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Optional, Sequence, Tuple, List
 
 from constants import CROPS, METALS, FRUITS, BERRIES, GRAINS
 from data import hydration_from_rainfall
@@ -81,6 +91,11 @@ GRADES_ALL = ['small', 'poor', 'normal', 'rich']
 TOOL_METALS = [key for key, val in METALS.items() if 'tool' in val.types]
 ANIMAL_NBT = '{NoAI:1b,birth:-100000000L,oldDay:9223372036854775807L,geneticSize:16}'
 
+WATCH_INTERVAL = 0.25  # Seconds between checking for changes, when watching
+LANG_DIR = './resources/lang'
+
+BOOKS: Dict[Tuple[bool, Tuple[str, ...] | None], Book] = {}  # The structure of the book is independent of the language, so it is only made once, keyed by local_instance and the categories being written
+
 
 class LocalInstance:
     INSTANCE_DIR = None
@@ -100,12 +115,16 @@ def main_with_args():
     parser = ArgumentParser('generate_book.py')
     parser.add_argument('--translate', type=str, default='en_us', help='The language to translate to')
     parser.add_argument('--local', type=str, default=None, help='The directory of a local .minecraft to copy into')
+    parser.add_argument('--category', type=str, action='append', dest='categories', default=None, help='Only writes the given category of the book. Can be used multiple times')
 
     args = parser.parse_args()
-    main(args.translate, args.local, False)
+    main(args.translate, args.local, False, categories=args.categories)
 
 
-def main(translate_lang: str, local_minecraft_dir: Optional[str], validate: bool, validating_rm: ResourceManager = None, reverse_translate: bool = False):
+def main(translate_lang: str, local_minecraft_dir: Optional[str], validate: bool, validating_rm: ResourceManager = None, reverse_translate: bool = False, categories: Sequence[str] | None = None):
+    """
+    :param categories: If present, only these categories are built and written. Translations used by other categories are kept, rather than removed as unused.
+    """
     LocalInstance.INSTANCE_DIR = local_minecraft_dir
 
     rm = ResourceManager('tfc', './src/main/resources')
@@ -114,17 +133,128 @@ def main(translate_lang: str, local_minecraft_dir: Optional[str], validate: bool
     i18n = I18n(translate_lang, validate)
 
     print('Writing book at %s' % translate_lang)
-    make_book(rm, i18n, local_instance=False, reverse_translate=reverse_translate)
+    book_of(local_instance=False, categories=categories).build(rm, i18n, reverse_translate, use_manifest=not validate)
 
-    i18n.flush()
+    i18n.flush(keep_unused=categories is not None)
 
     if LocalInstance.wrap(rm):
         print('Copying %s book into local instance at: %s' % (translate_lang, LocalInstance.INSTANCE_DIR))
-        make_book(rm, I18n(translate_lang, validate), local_instance=True)
+        book_of(local_instance=True, categories=categories).build(rm, I18n(translate_lang, validate))
+
+
+def main_all(translate_langs: Sequence[str], local_minecraft_dir: Optional[str], reverse_translate: bool = False, jobs: int = 1, categories: Sequence[str] | None = None):
+    """ Writes the book in multiple languages. The book is made once, and with `jobs > 1`, each language is translated and written in a separate process. """
+    start = time.perf_counter()
+    book_of(local_instance=False, categories=categories)
+    if local_minecraft_dir is not None:
+        book_of(local_instance=True, categories=categories)
+
+    if jobs > 1 and len(translate_langs) > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=set_books, initargs=(BOOKS,)) as pool:
+            # Output is collected from each process, and printed in order
+            for output in pool.map(main_with_output, translate_langs, repeat(local_minecraft_dir), repeat(reverse_translate), repeat(categories)):
+                print(output, end='')
+    else:
+        for lang in translate_langs:
+            main(lang, local_minecraft_dir, False, reverse_translate=reverse_translate, categories=categories)
+    print('Wrote book in %d languages in %.2fs' % (len(translate_langs), time.perf_counter() - start))
+
+
+def main_with_output(translate_lang: str, local_minecraft_dir: Optional[str], reverse_translate: bool, categories: Sequence[str] | None) -> str:
+    with io.StringIO() as output, contextlib.redirect_stdout(output):
+        main(translate_lang, local_minecraft_dir, False, reverse_translate=reverse_translate, categories=categories)
+        return output.getvalue()
+
+
+def set_books(books: Dict[Tuple[bool, Tuple[str, ...] | None], Book]):
+    BOOKS.update(books)
+
+
+def book_of(local_instance: bool, categories: Sequence[str] | None = None) -> Book:
+    """ The book, with all categories resolved, or only `categories` if present """
+    key = local_instance, None if categories is None else tuple(categories)
+    if key not in BOOKS:
+        book = make_book(local_instance)
+        book.resolve(categories)
+        BOOKS[key] = book
+    return BOOKS[key]
+
+
+def watch(translate_langs: Sequence[str], local_minecraft_dir: Optional[str], categories: Sequence[str] | None = None):
+    """
+    Rewrites the book whenever this file, or any translation, changes, until interrupted.
+    When this file changes, it is reloaded, otherwise the book is kept in memory. Only files whose content changed since the last rewrite are written, both to the resource directory and to the local instance, if present.
+    """
+    written: Dict[Tuple, str] = {}
+    rewrite(translate_langs, local_minecraft_dir, categories, written)
+    mtimes = watched_mtimes()
+    print('Watching %d files for changes to the book. Press Ctrl+C to stop' % len(mtimes))
+    try:
+        while True:
+            time.sleep(WATCH_INTERVAL)
+            new_mtimes = watched_mtimes()
+            changed = [path for path, mtime in new_mtimes.items() if mtimes.get(path) != mtime]
+            if not changed:
+                continue
+
+            start = time.perf_counter()
+            print('Changed: %s' % ', '.join(os.path.relpath(path) for path in changed))
+            try:
+                if os.path.abspath(__file__) in changed:
+                    importlib.reload(sys.modules[__name__])  # Replaces all functions, and clears BOOKS, so the book is made again
+                written_count, total_count = rewrite(translate_langs, local_minecraft_dir, categories, written)
+                print('Wrote %d / %d changed files in %.2fs, %.2fs after the last edit' % (written_count, total_count, time.perf_counter() - start, time.time() - max(new_mtimes[path] for path in changed) / 1e9))
+            except Exception:
+                traceback.print_exc()
+            mtimes = watched_mtimes()  # Translations are written by the rewrite, so they are only checked for changes after it
+    except KeyboardInterrupt:
+        print('Stopped watching')
+
+
+def rewrite(translate_langs: Sequence[str], local_minecraft_dir: Optional[str], categories: Sequence[str] | None, written: Dict[Tuple, str]) -> Tuple[int, int]:
+    """ Writes the book in each language, skipping files whose content is the same as when last written. Returns the number of files written, and the total. """
+    LocalInstance.INSTANCE_DIR = local_minecraft_dir
+    counts = [0, 0]
+    rm = write_changed(ResourceManager('tfc', './src/main/resources'), False, written, counts)
+    local_rm = LocalInstance.wrap(ResourceManager('tfc', './src/main/resources'))
+    if local_rm is not None:
+        local_rm = write_changed(local_rm, True, written, counts)
+
+    for lang in translate_langs:
+        i18n = I18n(lang, False)
+        book_of(local_instance=False, categories=categories).build(rm, i18n)
+        i18n.flush(keep_unused=categories is not None)
+        if local_rm is not None:
+            book_of(local_instance=True, categories=categories).build(local_rm, I18n(lang, False))
+    return counts[0], counts[1]
+
+
+def write_changed(rm: ResourceManager, local_instance: bool, written: Dict[Tuple, str], counts: List[int]) -> ResourceManager:
+    """ Wraps `rm.data()` to only write files whose data is different to when they were last written. `counts` is incremented with the number of files written, and the total. """
+    data = rm.data
+
+    def changed_data(name_parts: ResourceIdentifier, data_in: JsonObject, root_domain: str = 'data'):
+        key = local_instance, root_domain, *utils.str_path(name_parts)
+        digest = hashlib.sha256(repr(data_in).encode('utf-8')).hexdigest()
+        counts[1] += 1
+        if written.get(key) != digest:
+            data(name_parts, data_in, root_domain)
+            written[key] = digest
+            counts[0] += 1
+
+    rm.data = changed_data
+    return rm
+
 
+def watched_mtimes() -> Dict[str, int]:
+    paths = [os.path.abspath(__file__)]
+    with os.scandir(LANG_DIR) as it:
+        paths += [os.path.abspath(entry.path) for entry in it if entry.name.endswith('.json')]
+    return {path: os.stat(path).st_mtime_ns for path in paths}
 
-def make_book(rm: ResourceManager, i18n: I18n, local_instance: bool = False, reverse_translate: bool = False):
-    book = Book(rm, 'field_guide', {}, i18n, local_instance, reverse_translate)
+
+def make_book(local_instance: bool = False) -> Book:
+    book = Book('field_guide', {}, local_instance)
 
     book.template('multimultiblock', custom_component(0, 0, 'MultiMultiBlockComponent', {'multiblocks': '#multiblocks'}), text_component(0, 115))
 
@@ -142,7 +272,14 @@ def make_book(rm: ResourceManager, i18n: I18n, local_instance: bool = False, rev
     book.template('table', custom_component(0, 0, 'TableComponent', TABLE_KEYS), text_component(0, 115))
     book.template('table_small', custom_component(0, 0, 'TableComponent', TABLE_KEYS), text_component(0, 80))
 
-    book.category('the_world', 'The World', 'All about the natural world around you.', 'tfc:grass/loam', is_sorted=True, entries=(
+    book.lazy_category('the_world', make_the_world)
+    book.lazy_category('getting_started', make_getting_started)
+    book.lazy_category('mechanics', make_mechanics)
+    return book
+
+
+def make_the_world() -> Category:
+    return category('the_world', 'The World', 'All about the natural world around you.', 'tfc:grass/loam', is_sorted=True, entries=(
         entry('geology', 'Geology', 'tfc:rock/raw/shale', pages=(
             text('The world of TerraFirmaCraft is divided into large continents - landmasses many kilometers wide and seperated by oceans. In these, you may find mountain ranges, rivers, and many other environments.'),
             image('tfc:textures/gui/book/biomes/regions.png', text_contents='A typical TFC world viewed at a large scale.'),
@@ -489,7 +626,10 @@ def make_book(rm: ResourceManager, i18n: I18n, local_instance: bool = False, rev
             empty_last_page(),
         )),
     ))
-    book.category('getting_started', 'Getting Started', 'An introduction to surviving in the world of TerraFirmaCraft. How to survive the stone age and obtain your first pickaxe.', 'tfc:stone/axe/sedimentary', is_sorted=True, entries=(
+
+
+def make_getting_started() -> Category:
+    return category('getting_started', 'Getting Started', 'An introduction to surviving in the world of TerraFirmaCraft. How to survive the stone age and obtain your first pickaxe.', 'tfc:stone/axe/sedimentary', is_sorted=True, entries=(
         entry('introduction', 'Introduction', 'tfc:rock/loose/granite', pages=(
             text('In TerraFirmaCraft, the first things you can obtain are sticks, twigs, and loose rocks. They can be found in almost every climate, lying scattered on the ground. $(item)$(k:key.use)$() or break these to pick them up.'),
             multiblock('Example', 'A smattering of common sticks and stones.', False, pattern=(
@@ -678,7 +818,10 @@ def make_book(rm: ResourceManager, i18n: I18n, local_instance: bool = False, rev
             text('Depleting food or water completely results in sluggish movement and mining, and begin to take damage. If you die, your nutrition resets.'),
         )),
     ))
-    book.category('mechanics', 'Advanced Mechanics', 'Advanced sections of the tech tree, from the first pickaxe, all the way to colored steel.$(br2)$(br)$(bold)Note:$() you can search entries simply by starting to type anywhere!', 'tfc:metal/axe/red_steel', entries=(
+
+
+def make_mechanics() -> Category:
+    return category('mechanics', 'Advanced Mechanics', 'Advanced sections of the tech tree, from the first pickaxe, all the way to colored steel.$(br2)$(br)$(bold)Note:$() you can search entries simply by starting to type anywhere!', 'tfc:metal/axe/red_steel', entries=(
         # Possible new entries
         # todo: entity renderers have issues. squids don't work.
         entry('aqueducts', 'Aqueducts', 'tfc:rock/aqueduct/shale', pages=(
@@ -1427,8 +1570,6 @@ def make_book(rm: ResourceManager, i18n: I18n, local_instance: bool = False, rev
         )),
     ))
 
-    book.build()
-
 
 def make_crop_table(start_index: int, end_index: int) -> List[str | Dict[str, Any]]:
     crop_table = [
@@ -1,40 +1,123 @@
+"""
+Generates the colormaps, using `gradients`.
+
+Invoke like 'python generate_colormaps.py [names...]'. If no names are given, all colormaps are generated.
+Each colormap is keyed by a hash of its size and control points, and is skipped if it is unchanged since it was last generated. Keys are stored in `.cache/colormaps.json`.
+
+"""
+
+import hashlib
 import os
 import shutil
-from typing import Tuple
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import Tuple, Dict, Sequence
 
 import gradients
+import json_loader
 
 SRC = '../src/main/resources/assets/tfc/textures/colormap/'
+CACHE_FILE = '../.cache/colormaps.json'
+SIZE = 256, 256
+
+COLORMAPS: Dict[str, Tuple[Tuple[int, int, str], ...]] = {
+    'sky': ((0, 0, '#6697E7'), (255, 0, '#7ca5f7'), (0, 255, '#dec797'), (255, 255, '#ABAAE3'), (64, 64, '#6597CE')),
+    'fog': ((0, 0, '#8FB1E9'), (255, 0, '#b4a1e7'), (0, 255, '#EDCC97'), (255, 255, '#d7d6f6'), (64, 64, '#b0d2f7')),
+
+    'water': ((0, 0, '#4882C9'), (255, 0, '#273968')),
+
+    'grass': ((0, 0, '#217C3E'), (170, 0, '#557d51'), (230, 40, '#6D997A'), (47, 123, '#5D9C52'), (25, 173, '#FADA5A'), (50, 255, '#FBD259')),
+    'tall_grass': ((0, 0, '#218239'), (170, 0, '#56875A'), (230, 40, '#729985'), (47, 113, '#39AD54'), (25, 163, '#FFE56C'), (50, 255, '#F7E656')),
+
+    'foliage': ((0, 0, '#1D6233'), (255, 0, '57776D'), (0, 255, '#8EA825'), (255, 255, '#9C8733')),
+    'foliage_fall': (
+        (0, 0, '#68823E'), (60, 0, '#fbf236'), (120, 0, '#f06613'), (195, 0, '#e8201c'), (255, 0, '#7C592B'),
+        (0, 127, '#68823E'), (60, 127, '#fbf236'), (160, 127, '#f18e00'), (200, 127, '#f06613'), (255, 127, '#7C592B'),
+        (0, 255, '#68823E'), (90, 255, '#fbf236'), (190, 255, '#b1a145'), (230, 255, '#7C592B')),
+    'foliage_winter': ((97, 50, '#7C592B'), (97, 255, '#7C592B'), (92, 50, '#c2ab35'), (85, 50, '#1D6233'), (85, 255, '#956d37')),
+}
+
+# Colormaps which are copies of another colormap
+COPIES: Dict[str, str] = {
+    'water_fog': 'water',
+}
 
 
 def main():
-    make('sky.png', (0, 0, '#6697E7'), (255, 0, '#7ca5f7'), (0, 255, '#dec797'), (255, 255, '#ABAAE3'), (64, 64, '#6597CE'))
-    make('fog.png', (0, 0, '#8FB1E9'), (255, 0, '#b4a1e7'), (0, 255, '#EDCC97'), (255, 255, '#d7d6f6'), (64, 64, '#b0d2f7'))
+    parser = ArgumentParser('generate_colormaps.py')
+    parser.add_argument('names', nargs='*', help='The colormaps to generate, by default all of them. One of: %s' % ', '.join((*COLORMAPS, *COPIES)))
+    parser.add_argument('--jobs', type=int, default=os.cpu_count(), help='Renders colormaps using up to N processes')
+    parser.add_argument('--force', action='store_true', help='Renders colormaps even if they are unchanged')
+
+    args = parser.parse_args()
+    for name in args.names:
+        if name not in COLORMAPS and name not in COPIES:
+            parser.error('Unknown colormap: %s' % name)
+    generate(args.names or (*COLORMAPS, *COPIES), args.jobs, args.force)
+
 
-    make('water.png', (0, 0, '#4882C9'), (255, 0, '#273968'))
+def generate(names: Sequence[str], jobs: int = 1, force: bool = False):
+    start = time.perf_counter()
+    cache = load_cache()
 
-    make('grass.png', (0, 0, '#217C3E'), (170, 0, '#557d51'), (230, 40, '#6D997A'), (47, 123, '#5D9C52'), (25, 173, '#FADA5A'), (50, 255, '#FBD259'))
-    make('tall_grass.png', (0, 0, '#218239'), (170, 0, '#56875A'), (230, 40, '#729985'), (47, 113, '#39AD54'), (25, 163, '#FFE56C'), (50, 255, '#F7E656'))
+    # Copies need their source to be generated first
+    rendered = [name for name in COLORMAPS if name in names or any(COPIES[copy] == name for copy in names if copy in COPIES)]
+    pending = [name for name in rendered if force or not is_unchanged(cache, name)]
 
-    make('foliage.png', (0, 0, '#1D6233'), (255, 0, '57776D'), (0, 255, '#8EA825'), (255, 255, '#9C8733'))
-    make('foliage_fall.png',
-         (0, 0, '#68823E'), (60, 0, '#fbf236'), (120, 0, '#f06613'), (195, 0, '#e8201c'), (255, 0, '#7C592B'),
-         (0, 127, '#68823E'), (60, 127, '#fbf236'), (160, 127, '#f18e00'), (200, 127, '#f06613'), (255, 127, '#7C592B'),
-         (0, 255, '#68823E'), (90, 255, '#fbf236'), (190, 255, '#b1a145'), (230, 255, '#7C592B'))
-    make('foliage_winter.png', (97, 50, '#7C592B'), (97, 255, '#7C592B'), (92, 50, '#c2ab35'), (85, 50, '#1D6233'), (85, 255, '#956d37'))
+    if jobs > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            for name, key in zip(pending, pool.map(make, pending)):
+                cache[name] = key
+    else:
+        for name in pending:
+            cache[name] = make(name)
 
-    copy('water.png', 'water_fog.png')
+    for name in names:
+        if name in COPIES:
+            copy(COPIES[name] + '.png', name + '.png')
 
-    print('Done')
+    save_cache(cache)
+    print('Generated %d colormaps, skipped %d unchanged in %.2fs' % (len(pending), len(rendered) - len(pending), time.perf_counter() - start))
 
 
-def make(image: str, *points: Tuple[int, int, str]):
-    gradients.create(os.path.join(SRC, image), 256, 256, *points)
+def make(name: str) -> Dict[str, str]:
+    """ Renders a colormap, and returns its cache entry """
+    path = os.path.join(SRC, name + '.png')
+    gradients.create(path, *SIZE, *COLORMAPS[name])
+    return {'key': key_of(name), 'hash': hash_file(path)}
 
 
 def copy(src: str, dest: str):
     shutil.copy(os.path.join(SRC, src), os.path.join(SRC, dest))
 
 
+def is_unchanged(cache: Dict[str, Dict[str, str]], name: str) -> bool:
+    """ If the colormap was last generated with the same size and points, and has not been modified since """
+    path = os.path.join(SRC, name + '.png')
+    entry = cache.get(name)
+    return entry is not None and entry['key'] == key_of(name) and os.path.isfile(path) and entry['hash'] == hash_file(path)
+
+
+def key_of(name: str) -> str:
+    """ A hash of the size and points of a colormap, along with the source of `gradients`, so changes to rendering are picked up """
+    digest = hashlib.sha256(repr((SIZE, COLORMAPS[name])).encode('utf-8'))
+    digest.update(hash_file(gradients.__file__).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def hash_file(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_cache() -> Dict[str, Dict[str, str]]:
+    return json_loader.load_json_cache(CACHE_FILE, {})
+
+
+def save_cache(cache: Dict[str, Dict[str, str]]):
+    json_loader.save_json_cache(CACHE_FILE, cache)
+
+
 if __name__ == '__main__':
     main()
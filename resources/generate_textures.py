@@ -1,3 +1,12 @@
+import functools
+import io
+import os
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Tuple
+
+import numpy as np
 from PIL import Image, ImageDraw, ImageEnhance, ImageOps
 from PIL.Image import Transpose
 
@@ -8,20 +17,23 @@ path = './src/main/resources/assets/tfc/textures/'
 mc_path = './src/main/resources/assets/minecraft/textures/'
 templates = './resources/texture_templates/'
 
+# The number of images written, and skipped as unchanged, by save_image() in this process
+save_counts = {'written': 0, 'unchanged': 0}
+
 
 def overlay_image(front_file_dir, back_file_dir, result_dir, mask: str = None):
-    foreground = Image.open(front_file_dir + '.png').convert('RGBA')
-    background = Image.open(back_file_dir + '.png').convert('RGBA')
+    foreground = load_image(front_file_dir + '.png')
+    background = load_image(back_file_dir + '.png')
     if mask is None:
         mask = foreground
     else:
-        mask = Image.open(mask + '.png').convert('L')
+        mask = load_image(mask + '.png', 'L')
     background.paste(foreground, (0, 0), mask)
-    background.save(result_dir + '.png')
+    save_image(background, result_dir + '.png')
 
 def create_chest(wood: str):
-    log = Image.open(path + 'block/wood/log/%s' % wood + '.png').convert('RGBA').crop((0, 0, 14, 14))
-    sheet = Image.open(path + 'block/wood/sheet/%s' % wood + '.png').convert('RGBA').crop((0, 0, 14, 14))
+    log = load_image(path + 'block/wood/log/%s' % wood + '.png').crop((0, 0, 14, 14))
+    sheet = load_image(path + 'block/wood/sheet/%s' % wood + '.png').crop((0, 0, 14, 14))
     empty = (0, 0, 0, 0)
     frame = log.copy()
     ImageDraw.Draw(frame).rectangle((1, 1, 12, 12), fill=empty)
@@ -47,7 +59,7 @@ def create_chest(wood: str):
     blank.paste(shaded_square, (2, 2), shaded_square)
     cover = Image.alpha_composite(cover, blank)
 
-    handle = Image.open(templates + 'chest/handle.png').convert('RGBA')
+    handle = load_image(templates + 'chest/handle.png')
     normal = Image.new('RGBA', (64, 64), empty)
     normal.paste(handle, (0, 0), handle)
     normal.paste(cover, (14, 0), cover)
@@ -57,15 +69,15 @@ def create_chest(wood: str):
         normal.paste(side, (i * 14, 29), side)
     normal.paste(top, (14, 19), top)
     normal.paste(underside, (28, 19), underside)
-    normal.save(path + 'entity/chest/normal/%s' % wood + '.png')
+    save_image(normal, path + 'entity/chest/normal/%s' % wood + '.png')
     trapped = normal.copy()
-    trapped_overlay = Image.open(templates + 'chest/trapped_overlay.png')
+    trapped_overlay = load_image(templates + 'chest/trapped_overlay.png', None)
     trapped = Image.alpha_composite(trapped, trapped_overlay)
-    trapped.save(path + 'entity/chest/trapped/%s' % wood + '.png')
+    save_image(trapped, path + 'entity/chest/trapped/%s' % wood + '.png')
 
     # Double Chests
-    log_rect = Image.open(path + 'block/wood/log/%s' % wood + '.png').convert('RGBA').crop((0, 0, 15, 14))
-    sheet_rect = Image.open(path + 'block/wood/sheet/%s' % wood + '.png').convert('RGBA').crop((0, 0, 15, 14))
+    log_rect = load_image(path + 'block/wood/log/%s' % wood + '.png').crop((0, 0, 15, 14))
+    sheet_rect = load_image(path + 'block/wood/sheet/%s' % wood + '.png').crop((0, 0, 15, 14))
 
     top_right = sheet_rect.copy()
     top_right_frame = log_rect.copy()
@@ -119,7 +131,7 @@ def create_chest(wood: str):
     side_left.paste(log_section, (1, 13), log_section)
 
     normal_left = Image.new('RGBA', (64, 64), empty)
-    handle = Image.open(templates + 'chest/handle_left.png')
+    handle = load_image(templates + 'chest/handle_left.png', None)
     normal_left.paste(handle, (0, 0), handle)
     normal_left.paste(cover_right, (14, 0), cover_right)
     normal_left.paste(top_right, (29, 0), top_right)
@@ -131,13 +143,13 @@ def create_chest(wood: str):
     normal_left.paste(side, (29, 29), side)
     normal_left.paste(side_right, (14, 29), side_right)
     normal_left.paste(side_left, (43, 29), side_left)
-    normal_left.save(path + 'entity/chest/normal_left/%s' % wood + '.png')
-    left_trapped_overlay = Image.open(templates + 'chest/trapped_left_overlay.png')
+    save_image(normal_left, path + 'entity/chest/normal_left/%s' % wood + '.png')
+    left_trapped_overlay = load_image(templates + 'chest/trapped_left_overlay.png', None)
     left_trapped = Image.alpha_composite(normal_left, left_trapped_overlay)
-    left_trapped.save(path + 'entity/chest/trapped_left/%s' % wood + '.png')
+    save_image(left_trapped, path + 'entity/chest/trapped_left/%s' % wood + '.png')
 
     normal_right = Image.new('RGBA', (64, 64), empty)
-    handle = Image.open(templates + 'chest/handle_right.png')
+    handle = load_image(templates + 'chest/handle_right.png', None)
     normal_right.paste(handle, (0, 0), handle)
     normal_right.paste(cover_left, (14, 0), cover_left)
     normal_right.paste(top_left, (29, 0), top_left)
@@ -150,42 +162,42 @@ def create_chest(wood: str):
     normal_right.paste(side, (0, 29), side)
     normal_right.paste(side_left, (14, 29), side_right)
     normal_right.paste(side_right, (43, 29), side_left)
-    normal_right.save(path + 'entity/chest/normal_right/%s' % wood + '.png')
-    right_trapped_overlay = Image.open(templates + 'chest/trapped_right_overlay.png')
+    save_image(normal_right, path + 'entity/chest/normal_right/%s' % wood + '.png')
+    right_trapped_overlay = load_image(templates + 'chest/trapped_right_overlay.png', None)
     right_trapped = Image.alpha_composite(normal_right, right_trapped_overlay)
-    right_trapped.save(path + 'entity/chest/trapped_right/%s' % wood + '.png')
+    save_image(right_trapped, path + 'entity/chest/trapped_right/%s' % wood + '.png')
 
 def create_chest_boat(wood: str):
-    log = Image.open(path + 'block/wood/log/%s.png' % wood).convert('RGBA')
-    sheet = Image.open(path + 'block/wood/sheet/%s.png' % wood).convert('RGBA').transpose(Transpose.TRANSVERSE)
-    log_mask = Image.open(templates + 'chest_boat_log_mask.png').convert('L')
-    sheet_mask = Image.open(templates + 'chest_boat_sheet_mask.png').convert('L')
+    log = load_image(path + 'block/wood/log/%s.png' % wood)
+    sheet = load_image(path + 'block/wood/sheet/%s.png' % wood).transpose(Transpose.TRANSVERSE)
+    log_mask = load_image(templates + 'chest_boat_log_mask.png', 'L')
+    sheet_mask = load_image(templates + 'chest_boat_sheet_mask.png', 'L')
     big_log = fill_image(log, 128, 128, 16, 16)
     big_sheet = fill_image(sheet, 128, 128, 16, 16)
-    cover = Image.open(templates + 'chest_boat_static.png')
+    cover = load_image(templates + 'chest_boat_static.png', None)
 
     base = Image.new('RGBA', (128, 128))
     base.paste(big_log, mask=log_mask)
     base.paste(big_sheet, mask=sheet_mask)
     base.paste(cover, mask=cover)
-    base.save(path + 'entity/chest_boat/%s.png' % wood)
+    save_image(base, path + 'entity/chest_boat/%s.png' % wood)
 
 def create_hanging_sign(wood: str, metal: str):
     img = Image.new('RGBA', (64, 32))
-    sheet = Image.open(path + 'block/wood/sheet/%s.png' % wood).convert('RGBA').transpose(Transpose.TRANSVERSE)
+    sheet = load_image(path + 'block/wood/sheet/%s.png' % wood).transpose(Transpose.TRANSVERSE)
     big_sheet = fill_image(sheet, 64, 32, 16, 16)
-    mask = Image.open(templates + 'hanging_sign.png').convert('L')
+    mask = load_image(templates + 'hanging_sign.png', 'L')
     img.paste(big_sheet, mask=mask)
-    smooth = Image.open(path + 'block/metal/smooth/%s.png' % metal).convert('RGBA').transpose(Transpose.TRANSVERSE)
+    smooth = load_image(path + 'block/metal/smooth/%s.png' % metal).transpose(Transpose.TRANSVERSE)
     big_smooth = fill_image(smooth, 64, 32, 16, 16)
-    chain_mask = Image.open(templates + 'hanging_sign_chains.png').convert('L')
+    chain_mask = load_image(templates + 'hanging_sign_chains.png', 'L')
     img.paste(big_smooth, mask=chain_mask)
-    img.save(path + 'entity/signs/hanging/%s/%s.png' % (metal, wood))
+    save_image(img, path + 'entity/signs/hanging/%s/%s.png' % (metal, wood))
 
     img = Image.new('RGBA', (16, 16))
-    img.paste(sheet, mask=Image.open(templates + 'hanging_sign_edit.png').convert('L'))
-    img.paste(smooth, mask=Image.open(templates + 'hanging_sign_edit_overlay.png').convert('L'))
-    img.save(path + 'gui/hanging_signs/%s/%s.png' % (metal, wood))
+    img.paste(sheet, mask=load_image(templates + 'hanging_sign_edit.png', 'L'))
+    img.paste(smooth, mask=load_image(templates + 'hanging_sign_edit_overlay.png', 'L'))
+    save_image(img, path + 'gui/hanging_signs/%s/%s.png' % (metal, wood))
 
 def fill_image(tile_instance, width: int, height: int, tile_width: int, tile_height: int):
     image_instance = Image.new('RGBA', (width, height))
@@ -198,7 +210,7 @@ def stitch_images(width: int, height: int, name: str, paths: List[str]):
     img = Image.new('RGBA', (width, height))
     images = []
     for fp in paths:
-        images.append(Image.open(fp).convert('RGBA'))
+        images.append(load_image(fp))
     for i in range(0, int(width / 16)):
         for j in range(0, int(height / 16)):
             if len(images) == 0:
@@ -208,69 +220,85 @@ def stitch_images(width: int, height: int, name: str, paths: List[str]):
                 img.paste(images.pop(), (j * 16, i * 16))
 
 def create_bookshelf(wood: str):
-    planks = Image.open(path + 'block/wood/planks/%s' % wood + '.png').convert('RGBA')
-    mask = Image.open(templates + 'chiseled_bookshelf_mask.png').convert('L')
-    empty = Image.open(templates + 'chiseled_bookshelf_empty.png').convert('RGBA')
-    filled = Image.open(templates + 'chiseled_bookshelf_occupied.png').convert('RGBA')
+    planks = load_image(path + 'block/wood/planks/%s' % wood + '.png')
+    mask = load_image(templates + 'chiseled_bookshelf_mask.png', 'L')
+    empty = load_image(templates + 'chiseled_bookshelf_empty.png')
+    filled = load_image(templates + 'chiseled_bookshelf_occupied.png')
     empty.paste(planks, mask=mask)
     filled.paste(planks, mask=mask)
-    empty.save(path + 'block/wood/planks/%s_bookshelf_empty.png' % wood)
-    filled.save(path + 'block/wood/planks/%s_bookshelf_occupied.png' % wood)
+    save_image(empty, path + 'block/wood/planks/%s_bookshelf_empty.png' % wood)
+    save_image(filled, path + 'block/wood/planks/%s_bookshelf_occupied.png' % wood)
 
 def create_sign(wood: str):
-    log = Image.open(path + 'block/wood/log/%s' % wood + '.png').convert('RGBA')
-    planks = Image.open(path + 'block/wood/planks/%s' % wood + '.png').convert('RGBA')
+    log = load_image(path + 'block/wood/log/%s' % wood + '.png')
+    planks = load_image(path + 'block/wood/planks/%s' % wood + '.png')
     image = Image.new('RGBA', (64, 32), (0, 0, 0, 0))
     for coord in ((0, 0), (16, 0), (32, 0), (48, 0)):
         image.paste(planks, coord)
     image.paste(log, (0, 16))
-    image.save(path + 'entity/signs/%s.png' % wood)
+    save_image(image, path + 'entity/signs/%s.png' % wood)
 
 def create_sign_item(wood: str, log_color):
-    mast = Image.open(templates + 'sign_mast.png')
+    mast = load_image(templates + 'sign_mast.png', None)
     mast = put_on_all_pixels(mast, log_color)
-    mast.save(path + 'item/wood/sign/%s.png' % wood)
+    save_image(mast, path + 'item/wood/sign/%s.png' % wood)
 
 def create_hanging_sign_chains_item(metal: str, smooth_color):
-    chains = Image.open(templates + 'hanging_sign_head_chains.png')
+    chains = load_image(templates + 'hanging_sign_head_chains.png', None)
     chains = put_on_all_pixels(chains, smooth_color)
-    chains.save(path + 'item/metal/hanging_sign/%s.png' % metal)
+    save_image(chains, path + 'item/metal/hanging_sign/%s.png' % metal)
 
 def create_magma(rock: str):
     magma = Image.new('RGBA', (16, 48), (0, 0, 0, 0))
-    raw = Image.open(templates + '/raw/%s.png' % rock)
+    raw = load_image(templates + '/raw/%s.png' % rock, None)
     magma.paste(raw, (0, 0))
     magma.paste(raw, (0, 16))
     magma.paste(raw, (0, 32))
-    overlay = Image.open(templates + 'magma.png')
+    overlay = load_image(templates + 'magma.png', None)
     magma = Image.alpha_composite(magma, overlay)
-    magma.save(path + 'block/rock/magma/%s.png' % rock)
+    save_image(magma, path + 'block/rock/magma/%s.png' % rock)
 
 def create_horse_chest(wood: str, plank_color, log_color):
     for variant in ('chest', 'barrel'):
         image = Image.new('RGBA', (64, 64), (0, 0, 0, 0))
-        overlay = Image.open(templates + 'horse_%s_overlay.png' % variant).convert('RGBA')
-        frame = Image.open(templates + 'horse_%s_log.png' % variant).convert('RGBA')
-        body = Image.open(templates + 'horse_%s_sheet.png' % variant).convert('RGBA')
+        overlay = load_image(templates + 'horse_%s_overlay.png' % variant)
+        frame = load_image(templates + 'horse_%s_log.png' % variant)
+        body = load_image(templates + 'horse_%s_sheet.png' % variant)
         frame = put_on_all_pixels(frame, log_color)
         body = put_on_all_pixels(body, plank_color)
         image.paste(frame, (26, 21), frame)
         image.paste(body, (26, 21), body)
         image.paste(overlay, (26, 21), overlay)
         if variant == 'chest':
-            image.save(path + 'entity/chest/horse/%s.png' % wood)
+            save_image(image, path + 'entity/chest/horse/%s.png' % wood)
         elif variant == 'barrel':
-            image.save(path + 'entity/chest/horse/%s_barrel.png' % wood)
+            save_image(image, path + 'entity/chest/horse/%s_barrel.png' % wood)
 
 def get_wood_colors(wood_path: str):
-    wood = Image.open(path + 'block/wood/%s.png' % wood_path)
+    wood = load_image(path + 'block/wood/%s.png' % wood_path, None)
     return wood.getpixel((0, 0))
 
 def get_metal_colors(metal_path: str):
-    metal = Image.open(path + 'block/metal/%s.png' % metal_path)
+    metal = load_image(path + 'block/metal/%s.png' % metal_path, None)
     return metal.getpixel((0,0))
 
 def put_on_all_pixels(img: Image, color, dark_threshold: int = 50) -> Image:
+    if isinstance(color, int):
+        color = (color, color, color, 255)
+    img = img.convert('RGBA')
+    _, _, _, alpha = img.split()
+    hsv = np.array(img.convert('HSV'))
+    hue, sat, val = colorsys.rgb_to_hsv(color[0], color[1], color[2])
+    hsv[..., 0] = int(hue * 255)
+    hsv[..., 1] = int(sat * 255)
+    if val <= dark_threshold:
+        hsv[..., 2] //= 2
+    img = Image.fromarray(hsv, 'HSV').convert('RGBA')
+    img.putalpha(alpha)
+    return img
+
+def put_on_all_pixels_reference(img: Image, color, dark_threshold: int = 50) -> Image:
+    """ The per pixel implementation of put_on_all_pixels(), used to check and benchmark it """
     if isinstance(color, int):
         color = (color, color, color, 255)
     img = img.convert('RGBA')
@@ -287,13 +315,31 @@ def put_on_all_pixels(img: Image, color, dark_threshold: int = 50) -> Image:
     return img
 
 def create_boat_texture(wood: str):
-    img = Image.open(templates + 'boat.png').convert('RGBA')
-    palette_key = Image.open(path + 'color_palettes/wood/planks/palette.png').convert('RGBA')
-    palette = Image.open(path + 'color_palettes/wood/planks/%s.png' % wood).convert('RGBA')
+    img = load_image(templates + 'boat.png')
+    palette_key = load_image(path + 'color_palettes/wood/planks/palette.png')
+    palette = load_image(path + 'color_palettes/wood/planks/%s.png' % wood)
     manual_palette_swap(img, palette_key, palette)
-    img.save(path + 'entity/boat/%s.png' % wood)
+    save_image(img, path + 'entity/boat/%s.png' % wood)
 
 def manual_palette_swap(img: Image, palette_key: Image, palette: Image) -> Image:
+    """ Replaces every pixel of an RGBA image which is in palette_key, with the matching pixel in palette, in place. """
+    data = {}
+    for x in range(0, palette_key.width):
+        data[palette_key.getpixel((x, 0))] = palette.getpixel((x, 0))
+    # Pack each RGBA pixel into a single uint32, then look them up in the sorted palette keys
+    keys = np.array(list(data.keys()), dtype=np.uint8).view(np.uint32).ravel()
+    values = np.array(list(data.values()), dtype=np.uint8).view(np.uint32).ravel()
+    order = np.argsort(keys)
+    keys, values = keys[order], values[order]
+    pixels = np.array(img).view(np.uint32)[..., 0]
+    index = np.minimum(np.searchsorted(keys, pixels), len(keys) - 1)
+    found = keys[index] == pixels
+    pixels[found] = values[index[found]]
+    img.paste(Image.fromarray(pixels[..., np.newaxis].view(np.uint8), 'RGBA'))
+    return img
+
+def manual_palette_swap_reference(img: Image, palette_key: Image, palette: Image) -> Image:
+    """ The per pixel implementation of manual_palette_swap(), used to check and benchmark it """
     data = {}
     for x in range(0, palette_key.width):
         data[palette_key.getpixel((x, 0))] = palette.getpixel((x, 0))
@@ -304,55 +350,138 @@ def manual_palette_swap(img: Image, palette_key: Image, palette: Image) -> Image
                 img.putpixel((x, y), data[dat])
     return img
 
-# TODO IM BROKEN
-def main():
-    for wood in WOODS.keys():
-        for bench in ('workbench_front', 'workbench_side', 'workbench_top'):
-            overlay_image(templates + bench, path + 'block/wood/planks/%s' % wood, path + 'block/wood/planks/%s_' % wood + bench)
-        create_chest(wood)
-        create_sign(wood)
-        create_bookshelf(wood)
-        plank_color = get_wood_colors('planks/%s' % wood)
-        log_color = get_wood_colors('log/%s' % wood)
-        create_horse_chest(wood, plank_color, log_color)
-        create_chest_boat(wood)
-        if wood != 'palm':
-            create_boat_texture(wood)
-        for metal, metal_data in METALS.items():
-            if 'utility' in metal_data.types:
-                create_hanging_sign(wood, metal)
-
-    for rock, data in ROCKS.items():
-        overlay_image(templates + 'mossy_stone_bricks', path + 'block/rock/bricks/%s' % rock, path + 'block/rock/mossy_bricks/%s' % rock)
-        overlay_image(templates + 'mossy_cobblestone', path + 'block/rock/cobble/%s' % rock, path + 'block/rock/mossy_cobble/%s' % rock)
-        overlay_image(templates + 'mossy_loose_knapping', path + 'block/rock/raw/%s' % rock, path + 'gui/knapping/rock/mossy_loose/%s' % rock)
-        if data.category == 'igneous_intrusive' or data.category == 'igneous_extrusive':
-            create_magma(rock)
-
-    for soil in SOIL_BLOCK_VARIANTS:
-        overlay_image(templates + 'rooted_dirt', path + 'block/dirt/%s' % soil, path + 'block/rooted_dirt/%s' % soil)
-        overlay_image(path + 'block/dirt/%s' % soil, path + 'block/grass_path/%s_top' % soil, path + 'block/grass_path/%s_side' % soil, templates + 'grass_side_mask')
-        overlay_image(templates + 'mangrove_roots_side', path + 'block/mud/%s' % soil, path + 'block/mud/%s_roots_side' % soil)
-        overlay_image(templates + 'mangrove_roots_top', path + 'block/mud/%s' % soil, path + 'block/mud/%s_roots_top' % soil)
 
-    for metal, metal_data in METALS.items():
-        if 'utility' in metal_data.types:
-            overlay_image(path + 'block/metal/smooth/%s' % metal, path + 'block/empty', path + 'block/metal/chain/%s' % metal, templates + 'chain_mask')
-        if 'utility' in metal_data.types:
-            smooth_color = get_metal_colors('smooth/%s' % metal)
-            create_hanging_sign_chains_item(metal, smooth_color)
+def main(jobs: int = 1):
+    start = time.perf_counter()
+    tasks = [
+        *((create_wood, wood) for wood in WOODS.keys()),
+        *((create_rock, rock) for rock in ROCKS.keys()),
+        *((create_soil, soil) for soil in SOIL_BLOCK_VARIANTS),
+        *((create_metal, metal) for metal, metal_data in METALS.items() if 'utility' in metal_data.types),
+        (create_compasses, None),
+        (create_unsealed_jars, None),
+    ]
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(run_task, tasks))
+    else:
+        results = [run_task(task) for task in tasks]
 
+    print('Generated textures: Written = %d, Unchanged = %d in %.2fs' % (sum(r['written'] for r in results), sum(r['unchanged'] for r in results), time.perf_counter() - start))
 
+def run_task(task: Tuple[Callable, Any]) -> Dict[str, int]:
+    """ Runs a single texture generation task, and returns the number of images it wrote, or skipped as unchanged """
+    function, arg = task
+    before = dict(save_counts)
+    if arg is None:
+        function()
+    else:
+        function(arg)
+    return {key: save_counts[key] - before[key] for key in save_counts}
+
+def create_wood(wood: str):
+    for bench in ('workbench_front', 'workbench_side', 'workbench_top'):
+        overlay_image(templates + bench, path + 'block/wood/planks/%s' % wood, path + 'block/wood/planks/%s_' % wood + bench)
+    create_chest(wood)
+    create_sign(wood)
+    create_bookshelf(wood)
+    plank_color = get_wood_colors('planks/%s' % wood)
+    log_color = get_wood_colors('log/%s' % wood)
+    create_horse_chest(wood, plank_color, log_color)
+    create_chest_boat(wood)
+    if wood != 'palm':
+        create_boat_texture(wood)
+    for metal, metal_data in METALS.items():
+        if 'utility' in metal_data.types:
+            create_hanging_sign(wood, metal)
+
+def create_rock(rock: str):
+    data = ROCKS[rock]
+    overlay_image(templates + 'mossy_stone_bricks', path + 'block/rock/bricks/%s' % rock, path + 'block/rock/mossy_bricks/%s' % rock)
+    overlay_image(templates + 'mossy_cobblestone', path + 'block/rock/cobble/%s' % rock, path + 'block/rock/mossy_cobble/%s' % rock)
+    overlay_image(templates + 'mossy_loose_knapping', path + 'block/rock/raw/%s' % rock, path + 'gui/knapping/rock/mossy_loose/%s' % rock)
+    if data.category == 'igneous_intrusive' or data.category == 'igneous_extrusive':
+        create_magma(rock)
+
+def create_soil(soil: str):
+    overlay_image(templates + 'rooted_dirt', path + 'block/dirt/%s' % soil, path + 'block/rooted_dirt/%s' % soil)
+    overlay_image(path + 'block/dirt/%s' % soil, path + 'block/grass_path/%s_top' % soil, path + 'block/grass_path/%s_side' % soil, templates + 'grass_side_mask')
+    overlay_image(templates + 'mangrove_roots_side', path + 'block/mud/%s' % soil, path + 'block/mud/%s_roots_side' % soil)
+    overlay_image(templates + 'mangrove_roots_top', path + 'block/mud/%s' % soil, path + 'block/mud/%s_roots_top' % soil)
+
+def create_metal(metal: str):
+    overlay_image(path + 'block/metal/smooth/%s' % metal, path + 'block/empty', path + 'block/metal/chain/%s' % metal, templates + 'chain_mask')
+    smooth_color = get_metal_colors('smooth/%s' % metal)
+    create_hanging_sign_chains_item(metal, smooth_color)
+
+def create_compasses():
     for i in range(0, 32):
         number = str(i) if i > 9 else '0' + str(i)
         overlay_image(templates + 'compass_overlay', templates + 'compass/compass_%s' % number, mc_path + 'item/compass_%s' % number)
 
+def create_unsealed_jars():
     for fruit in JAR_FRUITS:
-        img = Image.open(path + 'item/jar/%s.png' % fruit).convert('RGBA')
+        img = load_image(path + 'item/jar/%s.png' % fruit)
         for x, y in ((7, 2), (8, 2), (9, 2), (7, 4), (8, 4), (9, 4)):
             img.putpixel((x, y), (0, 0, 0, 0))
-        img.save(path + 'item/jar/%s_unsealed.png' % fruit)
+        save_image(img, path + 'item/jar/%s_unsealed.png' % fruit)
+
+def load_image(file: str, mode: str | None = 'RGBA') -> Image:
+    """ Loads an image, converted to the given mode, or as-is if the mode is None. Returns a copy, which is safe to modify. """
+    return open_image(file, mode).copy()
+
+@functools.lru_cache(maxsize=512)
+def open_image(file: str, mode: str | None) -> Image:
+    img = Image.open(file)
+    img.load()
+    return img if mode is None else img.convert(mode)
+
+def save_image(img: Image, file: str):
+    """ Saves an image as a png, unless the file already has the same contents """
+    buffer = io.BytesIO()
+    img.save(buffer, 'png')
+    data = buffer.getvalue()
+    if os.path.isfile(file):
+        with open(file, 'rb') as f:
+            if f.read() == data:
+                save_counts['unchanged'] += 1
+                return
+    with open(file, 'wb') as f:
+        f.write(data)
+    save_counts['written'] += 1
+
+def benchmark():
+    """ Compares the per pixel and vectorized implementations of put_on_all_pixels() and manual_palette_swap(), over all woods """
+    elapsed = {}
+    def run(name: str, function, *args) -> Image:
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed[name] = elapsed.get(name, 0) + time.perf_counter() - start
+        return result
+
+    mast = Image.open(templates + 'sign_mast.png')
+    boat = Image.open(templates + 'boat.png').convert('RGBA')
+    palette_key = Image.open(path + 'color_palettes/wood/planks/palette.png').convert('RGBA')
+    for wood in WOODS.keys():
+        log_color = get_wood_colors('log/%s' % wood)
+        for threshold in (50, 255):
+            expected = run('put_on_all_pixels_reference', put_on_all_pixels_reference, mast, log_color, threshold)
+            actual = run('put_on_all_pixels', put_on_all_pixels, mast, log_color, threshold)
+            assert expected.tobytes() == actual.tobytes(), 'put_on_all_pixels() does not match for %s' % wood
+        if wood != 'palm':
+            palette = Image.open(path + 'color_palettes/wood/planks/%s.png' % wood).convert('RGBA')
+            expected = run('manual_palette_swap_reference', manual_palette_swap_reference, boat.copy(), palette_key, palette)
+            actual = run('manual_palette_swap', manual_palette_swap, boat.copy(), palette_key, palette)
+            assert expected.tobytes() == actual.tobytes(), 'manual_palette_swap() does not match for %s' % wood
+
+    for name in ('put_on_all_pixels', 'manual_palette_swap'):
+        print('%s: Per pixel: %.3fs, Vectorized: %.3fs, Speedup: %.1fx' % (name, elapsed[name + '_reference'], elapsed[name], elapsed[name + '_reference'] / elapsed[name]))
 
 
 if __name__ == '__main__':
-    main()
+    parser = ArgumentParser('generate_textures.py')
+    parser.add_argument('--benchmark', action='store_true', help='Compares the per pixel and vectorized image operations, instead of generating textures')
+    if parser.parse_args().benchmark:
+        benchmark()
+    else:
+        main()
@@ -1,11 +1,22 @@
+import functools
+import gzip
+import hashlib
+import io
 import os
+import time
 
+from argparse import ArgumentParser
 from collections import deque
-from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
 
+import numpy as np
 from nbtlib import nbt, File as RootTag
 from nbtlib.tag import String as StringTag, Int as IntTag, List as ListTag, Compound as CompoundTag
 
+import json_loader
+
 
 class Tree(NamedTuple):
     normal: str
@@ -50,7 +61,7 @@ class Worker(NamedTuple):
         return self.axis_states[self.log_positions[pos]]
 
     def palette(self) -> 'Palette':
-        return Palette([], [], self)
+        return Palette([], [], {}, self)
 
     def translate(self, offset: Pos) -> 'Worker':
         return Worker(self.size, self.axis_states, translate(self.log_positions, offset), translate(self.leaf_positions, offset), translate(self.root_positions, offset))
@@ -61,6 +72,7 @@ class Palette(NamedTuple):
 
     blocks: list[CompoundTag]
     palette: list[CompoundTag]
+    palette_ids: dict[tuple, int]  # Indexes into `palette`, by `block_key()`
     worker: Worker
 
     def add_blocks(self, wood: str, log_paths: dict[Pos, Pos], leaf_paths: dict[Pos, int]):
@@ -70,24 +82,48 @@ class Palette(NamedTuple):
         :param log_paths: The log positions, mapped to a branch direction
         :param leaf_paths: The leaf positions, mapped to a distance
         """
+        # Block tags are only created for each distinct log state (name, axis, branch direction) or leaf distance
+        log_ids: dict[tuple[str, str, Pos], int] = {}
         for log_pos, adj in log_paths.items():
             block_name, block_axis = self.worker.get_log(log_pos)
-            block = create_log_block_tag(wood, block_name, block_axis, adj)
+            state = block_name, str(block_axis), adj
+            block_id = log_ids.get(state)
+            if block_id is None:
+                block_id = log_ids[state] = self.intern(create_log_block_tag(wood, block_name, block_axis, adj))
 
-            self.add_block(log_pos, block)
+            self.add_entry(log_pos, block_id)
 
+        leaf_ids: dict[int, int] = {}
         for leaf_pos, dist in leaf_paths.items():
-            block = create_leaf_block_tag(wood, dist)
+            block_id = leaf_ids.get(dist)
+            if block_id is None:
+                block_id = leaf_ids[dist] = self.intern(create_leaf_block_tag(wood, dist))
 
-            self.add_block(leaf_pos, block)
+            self.add_entry(leaf_pos, block_id)
 
     def add_block(self, pos: Pos, block: CompoundTag):
+        self.add_entry(pos, self.intern(block))
+
+    def intern(self, block: CompoundTag) -> int:
+        """ Returns the index of a block in the palette, adding it if not present """
+        key = block_key(block)
+        block_id = self.palette_ids.get(key)
+        if block_id is None:
+            block_id = self.palette_ids[key] = len(self.palette)
+            self.palette.append(block)
+        return block_id
+
+    def add_block_linear(self, pos: Pos, block: CompoundTag):
+        """ The previous implementation of `add_block()`, which searches the palette. Used by `benchmark()` """
         if block in self.palette:
             block_id = self.palette.index(block)
         else:
             block_id = len(self.palette)
             self.palette.append(block)
 
+        self.add_entry(pos, block_id)
+
+    def add_entry(self, pos: Pos, block_id: int):
         entry = CompoundTag()
         entry['state'] = IntTag(block_id)
         entry['pos'] = ListTag([IntTag(pos.x), IntTag(pos.y), IntTag(pos.z)])
@@ -220,6 +256,9 @@ RANDOM = 'random'
 STACKED = 'stacked'
 
 
+# The wood name used in cached structure templates, which is replaced per wood, see `with_wood()`
+WOOD_PLACEHOLDER = '$wood'
+
 # The data version used by DFU
 # Keep this up-to-date with the version in SharedConstants.VERSION
 DATA_VERSION = 3465
@@ -227,20 +266,52 @@ DATA_VERSION = 3465
 TEMPLATES_DIR = './resources/structure_templates'
 STRUCTURES_DIR = './src/main/resources/data/tfc/structures'
 
+# A manifest of the hash of the uncompressed NBT of each saved structure, along with the size and modification time of the file it was saved to
+# This is used by `save_structure()` to avoid loading and comparing existing structures which are unchanged
+STRUCTURES_MANIFEST = './.cache/structures.json'
+
 # If `STRICT_MODE` is true, it performs some additional checks on the structure of trees that may not hold in general
 # These should be used to help while making tree structures and only ignored if they're catching false positives.
 STRICT_CHECKS: bool = False
 
+# If `GRID_BACKEND` is true, log and leaf paths are found using a dense voxel grid, see `VoxelGrid`. This produces identical results.
+GRID_BACKEND: bool = False
+
 
-def main():
+def main(jobs: int = 1, grid: bool = False):
+    """
+    :param jobs: If > 1, each tree variant is generated independently using up to this many processes.
+    :param grid: If true, uses the voxel grid backend to find log and leaf paths.
+    """
     print('Generating...')
+    start = time.perf_counter()
+    manifest = load_structures_manifest()
+    set_worker_state(grid, manifest)
+
+    tasks = [
+        (name, template, suffix)
+        for name, tree in TREES.items()
+        for template, suffix in ((tree.normal, ''), (tree.large, '_large'), (tree.dead, '_dead'))
+    ]
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=set_worker_state, initargs=(grid, manifest)) as pool:
+            results = list(pool.map(make_tree_timed, tasks))
+    else:
+        results = [make_tree_timed(task) for task in tasks]
 
     leaves: dict[str, int] = {}
-    for name, tree in TREES.items():
-        print('   ', name)
-        leaves[name] = make_tree(name, tree.normal)
-        make_tree(name, tree.large, '_large')
-        make_tree(name, tree.dead, '_dead')
+    elapsed: dict[str, float] = {}
+    saved_manifest = dict(manifest)
+    for (name, _, suffix), (count, task_elapsed, task_manifest_updates) in zip(tasks, results):
+        if suffix == '':
+            leaves[name] = count
+        elapsed[name] = elapsed.get(name, 0) + task_elapsed
+        saved_manifest.update(task_manifest_updates)
+    save_structures_manifest(saved_manifest)
+
+    for name, tree_elapsed in elapsed.items():
+        print('    %s: %.2fs' % (name, tree_elapsed))
+    print('Generated %d trees in %.2fs' % (len(elapsed), time.perf_counter() - start))
 
     print('# Automatically Generated by generate_trees.py')
     print('TREE_SAPLING_DROP_CHANCES = {')
@@ -254,6 +325,21 @@ def main():
     print('}')
 
 
+def set_worker_state(grid: bool, manifest: dict[str, list]):
+    """ Sets the backend, and a read-only view of the structures manifest as loaded at the start of the run, for the current process """
+    global GRID_BACKEND, structures_manifest
+    GRID_BACKEND = grid
+    structures_manifest = MappingProxyType(manifest)
+
+
+def make_tree_timed(task: tuple[str, str | None, str]) -> tuple[int, float, dict[str, list]]:
+    """ Runs `make_tree()` for a single (wood, tree, suffix) task, returning the leaf count, the time taken, and any updates to the structures manifest """
+    start = time.perf_counter()
+    manifest_updates.clear()
+    count = make_tree(*task)
+    return count, time.perf_counter() - start, dict(manifest_updates)
+
+
 def make_tree(wood: str, tree: str | None, suffix: str = '') -> int:
     """ Generates tree structures for a given wood type + tree template type
     :param wood: The name of the tree to be generated (a TFC wood type)
@@ -333,7 +419,15 @@ def infer_type(wood: str) -> tuple[str, None | int | tuple[int, ...]]:
 
 
 def make_single_structure(wood: str, name: str) -> tuple[RootTag, int]:
+    root, leaves = make_single_template(name)
+    return with_wood(root, wood), leaves
+
+
+@functools.lru_cache(maxsize=None)
+def make_single_template(name: str) -> tuple[RootTag, int]:
     # Decompose a single structure, based on `tree` and `n`
+    # This is independent of the wood type, which is added by `with_wood()`, so it is cached per template
+    wood = WOOD_PLACEHOLDER
     root_nbt: RootTag = nbt.load('%s/%s.nbt' % (TEMPLATES_DIR, name))
     worker = make_worker(root_nbt)
     parity = worker.size.x % 2, worker.size.z % 2
@@ -377,7 +471,15 @@ def make_single_structure(wood: str, name: str) -> tuple[RootTag, int]:
 
 
 def make_overlay_tree(wood: str, tree: str) -> tuple[RootTag, RootTag, int]:
+    base, overlay, leaves = make_overlay_template(tree)
+    return with_wood(base, wood), with_wood(overlay, wood), leaves
+
+
+@functools.lru_cache(maxsize=None)
+def make_overlay_template(tree: str) -> tuple[RootTag, RootTag, int]:
     # Decompose the base and overlay structure
+    # This is independent of the wood type, which is added by `with_wood()`, so it is cached per template
+    wood = WOOD_PLACEHOLDER
     # When pathing the overlay structure, apply it additively to the base structure
     base_nbt: RootTag = nbt.load('%s/%s.nbt' % (TEMPLATES_DIR, tree))
     overlay_nbt: RootTag = nbt.load('%s/%s_overlay.nbt' % (TEMPLATES_DIR, tree))
@@ -425,6 +527,19 @@ def make_overlay_tree(wood: str, tree: str) -> tuple[RootTag, RootTag, int]:
     return palette.make_root(), overlay_palette.make_root(), len(leaf_paths)
 
 
+def with_wood(root_nbt: RootTag, wood: str) -> RootTag:
+    """ Replaces the placeholder wood in the palette of a structure template. The returned structure shares all other tags with the template. """
+    entries = []
+    for block in root_nbt['palette']:
+        entry = CompoundTag({'Name': StringTag(str(block['Name']).replace(WOOD_PLACEHOLDER, wood))})
+        properties = block.get('Properties')
+        if properties is not None:  # Blocks without any states, such as air, have no properties
+            entry['Properties'] = properties
+        entries.append(entry)
+    palette = ListTag(entries)
+    return RootTag({key: palette if key == 'palette' else tag for key, tag in root_nbt.items()})
+
+
 def make_worker(root_nbt: RootTag):
     """
     Common parts of all tree construction
@@ -487,6 +602,9 @@ def find_log_paths(root_positions: list[Pos], log_positions: dict[Pos, int], enq
     :return: A mapping of log positions to their branch direction
 
     """
+    if GRID_BACKEND:
+        return find_log_paths_grid(root_positions, log_positions, enqueue)
+
     queue = deque(root_positions)
     paths: dict[Pos, Pos] = {pos: TRUNK_ROOT for pos in root_positions}
     while queue:
@@ -518,6 +636,9 @@ def find_leaf_paths(log_positions: dict[Pos, int], leaf_positions: dict[Pos, int
     :param leaf_positions: The set of all possible leaf positions
     :return: A mapping of leaf positions the distance to the nearest log
     """
+    if GRID_BACKEND:
+        return find_leaf_paths_grid(log_positions, leaf_positions)
+
     queue = deque([(pos, 0) for pos in log_positions])
     paths: dict[Pos, int] = {}
     while queue:
@@ -535,6 +656,108 @@ def find_leaf_paths(log_positions: dict[Pos, int], leaf_positions: dict[Pos, int
     return paths
 
 
+class VoxelGrid(NamedTuple):
+    """ A dense grid covering a set of positions, with a border of one block on each side. Positions are indexed by a single integer, so neighbours are found by adding a fixed offset. """
+
+    origin: Pos
+    size: Pos
+
+    @staticmethod
+    def around(positions: list[Pos]) -> 'VoxelGrid':
+        if not positions:
+            return VoxelGrid(Pos(0, 0, 0), Pos(1, 1, 1))
+        array = np.array(positions, dtype=np.int64).reshape(-1, 3)
+        lower, upper = array.min(axis=0) - 1, array.max(axis=0) + 1
+        return VoxelGrid(Pos(*lower.tolist()), Pos(*(upper - lower + 1).tolist()))
+
+    def volume(self) -> int:
+        return self.size.x * self.size.y * self.size.z
+
+    def index(self, positions: list[Pos]) -> np.ndarray:
+        array = np.array(positions, dtype=np.int64).reshape(-1, 3) - self.origin
+        return (array[:, 0] * self.size.y + array[:, 1]) * self.size.z + array[:, 2]
+
+    def offset(self, offset: Pos) -> int:
+        return (offset.x * self.size.y + offset.y) * self.size.z + offset.z
+
+    def mask(self, positions: list[Pos]) -> np.ndarray:
+        mask = np.zeros(self.volume(), dtype=bool)
+        mask[self.index(positions)] = True
+        return mask
+
+
+# The offsets used by the leaf BFS, in the order they are iterated in `find_leaf_paths()`
+LEAF_DIRECTIONS: list[Pos] = [Pos(dx, dy, dz) for dx in (-1, 0, 1) for dy in (-1, 0, 1) for dz in (-1, 0, 1) if Pos(dx, dy, dz).norm1() == 1]
+
+
+def find_log_paths_grid(root_positions: list[Pos], log_positions: dict[Pos, int], enqueue: bool = True) -> dict[Pos, Pos]:
+    """ Identical to `find_log_paths()`, but using a voxel grid, with branch directions stored as indexes into `NORMAL_BRANCH_DIRECTIONS` """
+    logs = list(log_positions)
+    grid = VoxelGrid.around(root_positions + logs)
+    roots = grid.index(root_positions).tolist()
+    is_log = grid.mask(logs).tolist()
+    offsets = [grid.offset(offset) for offset in NORMAL_BRANCH_DIRECTIONS]
+    positions = dict(zip(roots + grid.index(logs).tolist(), root_positions + logs))
+
+    direction = [-1] * grid.volume()
+    order = []  # Indexes in the order they are first found, which matches the insertion order in `find_log_paths()`
+    for root in roots:
+        if direction[root] == -1:
+            order.append(root)
+        direction[root] = BRANCH_STRENGTH[TRUNK_ROOT]
+
+    queue = deque(roots)
+    while queue:
+        pos = queue.popleft()
+        for i in range(1, len(offsets)):  # Skip Pos(0, 0, 0), where adj == pos
+            adj = pos - offsets[i]
+            if is_log[adj]:
+                if direction[adj] == -1:
+                    direction[adj] = i
+                    order.append(adj)
+                    if enqueue:
+                        queue.append(adj)
+                elif i < direction[adj] and pos + offsets[direction[pos]] != adj:
+                    direction[adj] = i
+
+    paths = {positions[i]: NORMAL_BRANCH_DIRECTIONS[direction[i]] for i in order}
+    assert len(paths) >= len(log_positions), 'Structure is disconnected - %d unreachable logs at %s' % (len(log_positions) - len(paths), log_positions.keys() - paths.keys())
+    return paths
+
+
+def find_leaf_paths_grid(log_positions: dict[Pos, int], leaf_positions: dict[Pos, int]) -> dict[Pos, int]:
+    """ Identical to `find_leaf_paths()`, but using a voxel grid, and expanding each distance from the logs at once """
+    logs, leaves = list(log_positions), list(leaf_positions)
+
+    grid = VoxelGrid.around(logs + leaves)
+    is_leaf = grid.mask(leaves)
+    visited = np.zeros(grid.volume(), dtype=bool)
+    offsets = np.array([grid.offset(offset) for offset in LEAF_DIRECTIONS], dtype=np.int64)
+    positions = dict(zip(grid.index(leaves).tolist(), leaves))
+
+    paths: dict[Pos, int] = {}
+    frontier = grid.index(logs)
+    distance = 0
+    while frontier.size:
+        # Neighbours ordered by their position in the frontier, then by offset, and only keeping the first of any duplicates, matches the order of the queue in `find_leaf_paths()`
+        adj = (frontier[:, np.newaxis] + offsets).ravel()
+        adj = adj[is_leaf[adj] & ~visited[adj]]
+        _, first = np.unique(adj, return_index=True)
+        frontier = adj[np.sort(first)]
+        visited[frontier] = True
+        distance += 1
+        for i in frontier.tolist():
+            paths[positions[i]] = distance
+
+    assert len(paths) == len(leaf_positions), 'Structure is disconnected - %d unreachable leaves at %s' % (len(leaf_positions) - len(paths), leaf_positions.keys() - paths.keys())
+    return paths
+
+
+def block_key(block: CompoundTag) -> tuple:
+    """ A hashable key for a block state tag, which is equal for two tags iff the tags are equal. For logs this is the name, axis and branch direction, and for leaves, the name and distance. """
+    return str(block['Name']), tuple(sorted((key, type(value).__name__, str(value)) for key, value in block['Properties'].items()))
+
+
 def create_log_block_tag(wood: str, block_name: str, block_axis: StringTag, adj: Pos) -> CompoundTag:
     """ Creates the NBT tag for a log block. """
 
@@ -570,16 +793,45 @@ def save_structure(path: str, root_nbt: RootTag):
     # Uncomment for hotswap
     # root_nbt.save('./out/production/resources/data/tfc/structures/' + path.replace('/', '_'), gzipped=True)
 
+    buffer = io.BytesIO()
+    root_nbt.write(buffer)
+    data = buffer.getvalue()
+    digest = hashlib.sha256(data).hexdigest()
+
     path = os.path.join(STRUCTURES_DIR, path)
     if os.path.isfile(path):
-        old_nbt = nbt.load(path)
-        if root_nbt == old_nbt:
+        stat = os.stat(path)
+        entry = structures_manifest.get(path)
+        if entry is not None and entry[1:] == [stat.st_size, stat.st_mtime_ns]:
+            # The file is unchanged since it was saved, so comparing hashes is enough to tell if the structure is unchanged
+            if entry[0] == digest:
+                return
+        elif root_nbt == nbt.load(path):
             # Avoid replacing if the file exists and compares identical, because gzip is not deterministic
             # This avoids unnecessary git diffs
+            manifest_updates[path] = [digest, stat.st_size, stat.st_mtime_ns]
             return
 
     os.makedirs(os.path.dirname(path), exist_ok=True)
-    root_nbt.save(path, gzipped=True)
+    with gzip.open(path, 'wb') as f:
+        f.write(data)
+    stat = os.stat(path)
+    manifest_updates[path] = [digest, stat.st_size, stat.st_mtime_ns]
+
+
+def load_structures_manifest() -> dict[str, list]:
+    return json_loader.load_json_cache(STRUCTURES_MANIFEST, {})
+
+
+def save_structures_manifest(manifest: dict[str, list]):
+    json_loader.save_json_cache(STRUCTURES_MANIFEST, manifest)
+
+
+# The structures manifest as loaded at the start of the run, which is read by `save_structure()`. Set by `set_worker_state()`
+structures_manifest: Mapping[str, list] = MappingProxyType({})
+
+# Updates to the structures manifest made by `save_structure()` during the current task
+manifest_updates: dict[str, list] = {}
 
 
 def translate(positions: dict | set, offset: Pos) -> dict | set:
@@ -590,5 +842,48 @@ def translate(positions: dict | set, offset: Pos) -> dict | set:
     raise AssertionError('No idea how to translate %s' % repr(positions))
 
 
+def benchmark(count: int = 10):
+    """ Compares building palettes with `Palette.add_block()` and `Palette.add_block_linear()`, for the largest templates """
+    templates = []
+    for file in os.listdir(TEMPLATES_DIR):
+        try:
+            worker = make_worker(nbt.load(os.path.join(TEMPLATES_DIR, file)))
+            log_paths = find_log_paths(sorted(worker.root_positions), worker.log_positions)
+            leaf_paths = find_leaf_paths(worker.log_positions, worker.leaf_positions)
+        except AssertionError:
+            continue  # Overlays, and other templates which can't be pathed alone
+        templates.append((len(log_paths) + len(leaf_paths), file, worker, log_paths, leaf_paths))
+    templates.sort(key=lambda t: (-t[0], t[1]))
+
+    total_linear = total = 0
+    for size, file, worker, log_paths, leaf_paths in templates[:count]:
+        start = time.perf_counter()
+        linear = worker.palette()
+        for pos, adj in log_paths.items():
+            linear.add_block_linear(pos, create_log_block_tag('oak', *worker.get_log(pos), adj))
+        for pos, dist in leaf_paths.items():
+            linear.add_block_linear(pos, create_leaf_block_tag('oak', dist))
+        elapsed_linear = time.perf_counter() - start
+
+        start = time.perf_counter()
+        palette = worker.palette()
+        palette.add_blocks('oak', log_paths, leaf_paths)
+        elapsed = time.perf_counter() - start
+
+        assert palette.make_root() == linear.make_root(), 'Palettes do not match for %s' % file
+        total_linear += elapsed_linear
+        total += elapsed
+        print('%s: %d blocks, %d states: Linear: %.3fs, Interned: %.3fs' % (file, size, len(palette.palette), elapsed_linear, elapsed))
+    print('Total: Linear: %.3fs, Interned: %.3fs, Speedup: %.1fx' % (total_linear, total, total_linear / total))
+
+
 if __name__ == '__main__':
-    main()
+    parser = ArgumentParser('generate_trees.py')
+    parser.add_argument('--jobs', type=int, default=1, help='Generates each tree variant in a separate process, using up to N processes')
+    parser.add_argument('--trees-grid', action='store_true', dest='trees_grid', help='Uses a NumPy voxel grid to find log and leaf paths')
+    parser.add_argument('--benchmark', action='store_true', help='Compares building palettes by searching, and by interning block states, instead of generating trees')
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark()
+    else:
+        main(args.jobs, args.trees_grid)
@@ -1,6 +1,8 @@
+import time
 from argparse import ArgumentParser
 from typing import NamedTuple, Tuple, List, TypeVar
 
+import numpy as np
 from PIL import Image
 
 Point = NamedTuple('Point', x=int, y=int, r=int, g=int, b=int)
@@ -12,6 +14,7 @@ def main():
     parser.add_argument('spec', type=str, default='', help='Fixed points, in the form x0,y0,c0;x1,y1,c1...')
     parser.add_argument('--size', type=str, default='256x256', help='The size of image to generate, in WxH format')
     parser.add_argument('--out', type=str, default='result.png', help='Output file')
+    parser.add_argument('--benchmark', action='store_true', help='Compares rendering the image per pixel, and vectorized, instead of saving it')
 
     args = parser.parse_args()
     print('Running with', args)
@@ -33,10 +36,32 @@ def main():
         print(e)
         return
 
-    create(args.out, w, h, *points)
+    if args.benchmark:
+        benchmark(w, h, *points)
+    else:
+        create(args.out, w, h, *points)
 
 
 def create(file: str, w: int, h: int, *points: Tuple[int, int, str]):
+    render(w, h, parse_points(w, h, points)).save(file)
+
+
+def benchmark(w: int, h: int, *points: Tuple[int, int, str]):
+    points = parse_points(w, h, points)
+
+    start = time.perf_counter()
+    expected = render_pixels(w, h, points)
+    elapsed_pixels = time.perf_counter() - start
+
+    start = time.perf_counter()
+    actual = render(w, h, points)
+    elapsed = time.perf_counter() - start
+
+    assert expected.tobytes() == actual.tobytes(), 'Vectorized render does not match per pixel render'
+    print('Per pixel: %.3fs, Vectorized: %.3fs, Speedup: %.1fx' % (elapsed_pixels, elapsed, elapsed_pixels / elapsed))
+
+
+def parse_points(w: int, h: int, points: Tuple[Tuple[int, int, str], ...]) -> List[Point]:
     def point(p: Tuple[int, int, str]):
         x, y, c = p
         if not (0 <= x < w and 0 <= y < h):
@@ -48,8 +73,35 @@ def create(file: str, w: int, h: int, *points: Tuple[int, int, str]):
         c = int(c, base=16)
         return Point(x, y, (c >> 16) & 0xFF, (c >> 8) & 0xFF, c & 0xFF)
 
-    points = [point(p) for p in points]
+    return [point(p) for p in points]
+
+
+def render(w: int, h: int, points: List[Point]) -> Image.Image:
+    """ Renders the gradient over all pixels at once. This is identical to `render_pixels()`, as each operation is done in the same order, in the same precision, as `blend()` """
+    y, x = np.indices((h, w), dtype=np.int64)
+
+    ratios = []
+    for i1, p1 in enumerate(points):
+        ratio = np.ones((h, w))
+        for i2, p2 in enumerate(points):
+            if i1 != i2:
+                _, d2 = project(p1, p2, x, y)
+                ratio *= np.clip(d2, 0, 1)
+        ratios.append(ratio)
+
+    total = sum(ratios)
+    ratios = [t / total for t in ratios]
+
+    r = g = b = 0
+    for p, ra in zip(points, ratios):
+        r = r + p.r * ra
+        g = g + p.g * ra
+        b = b + p.b * ra
+    return Image.fromarray(np.clip(np.round(np.stack((r, g, b), axis=-1)), 0, 255).astype(np.uint8), 'RGB')
+
 
+def render_pixels(w: int, h: int, points: List[Point]) -> Image.Image:
+    """ Renders the gradient one pixel at a time """
     image = Image.new('RGB', (w, h))
     pixels = image.load()
 
@@ -58,7 +110,7 @@ def create(file: str, w: int, h: int, *points: Tuple[int, int, str]):
             c = blend(points, x, y)
             pixels[x, y] = c
 
-    image.save(file)
+    return image
 
 
 def blend(points: List[Point], x: int, y: int) -> Tuple[int, int, int]:
@@ -84,7 +136,7 @@ def mix(points: List[Point], ratios: List[float]) -> Tuple[int, int, int]:
     return clamp(round(r), 0, 255), clamp(round(g), 0, 255), clamp(round(b), 0, 255)
 
 
-def project(a: Point, b: Point, x: int, y: int) -> Tuple[float, float]:
+def project(a: Point, b: Point, x: int | np.ndarray, y: int | np.ndarray) -> Tuple[float, float]:
     k2 = b.x * b.x - b.x * a.x + b.y * b.y - b.y * a.y
     k1 = a.x * a.x - b.x * a.x + a.y * a.y - b.y * a.y
     ab2 = (a.x - b.x) * (a.x - b.x) + (a.y - b.y) * (a.y - b.y)
@@ -1,7 +1,10 @@
 import json
 import os
+from collections import defaultdict
+from typing import Dict, List, Tuple, Optional
 
-import Levenshtein
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
 
 
 class I18n:
@@ -17,6 +20,7 @@ class I18n:
 
         self.fuzzy_matches = 0
         self.fuzzy_non_matches = 0
+        self.fuzzy_index: Optional[Dict[int, List[Tuple[str, str]]]] = None  # Lowercase and original keys of `before`, by length. Built on the first fuzzy match
         
         # Default translation
         if not os.path.isfile(self.lang_path):
@@ -52,7 +56,7 @@ class I18n:
         else:
             # Try a fuzzy matcher (if we're not in en_us)
             # Use the lowercase of both keys, as difference in capitalization is almost surely not a translation issue
-            distance, match = min(((Levenshtein.distance(text.lower(), key.lower()), key) for key in self.before.keys()))
+            distance, match = self.fuzzy_match(text)
             if distance / len(text) < 0.1 and distance < 20:  # Heuristic: < 5% of text, and < 20 overall distance
                 if self.before[match] == match:
                     # This has just matched a default key that was inserted in the translated files
@@ -71,8 +75,38 @@ class I18n:
         self.after[text] = translated
         return translated
 
-    def flush(self):
-        """ Updates the local translation file, if needed """
+    def fuzzy_match(self, text: str) -> Tuple[int, str]:
+        """
+        Finds the key with the minimum (Levenshtein distance, key), using the lowercase of both, as long as that could pass the heuristic in `translate()`.
+        Keys which can't pass are pruned by length, and the distance to the rest is computed with a cutoff. If no key can pass, returns a distance which fails the heuristic.
+        """
+        if self.fuzzy_index is None:
+            self.fuzzy_index = defaultdict(list)
+            for key in self.before.keys():
+                self.fuzzy_index[len(key.lower())].append((key.lower(), key))
+
+        # The largest distance which passes the heuristic
+        cutoff = -1
+        while cutoff + 1 < 20 and (cutoff + 1) / len(text) < 0.1:
+            cutoff += 1
+        if cutoff < 0:
+            return 20, text
+
+        # The distance is at least the difference in length, so only keys with a similar length are candidates
+        lower = text.lower()
+        candidates = [candidate for length in range(len(lower) - cutoff, len(lower) + cutoff + 1) for candidate in self.fuzzy_index.get(length, ())]
+        matches = process.extract(lower, [c[0] for c in candidates], scorer=Levenshtein.distance, processor=None, score_cutoff=cutoff, limit=None)
+        if not matches:
+            return 20, text
+        return min((distance, candidates[i][1]) for _, distance, i in matches)
+
+    def flush(self, keep_unused: bool = False):
+        """
+        Updates the local translation file, if needed
+        :param keep_unused: If true, existing entries which were not used are kept. This is used when only part of the book was built.
+        """
+        if keep_unused:
+            self.after = {**self.before, **self.after}
         if not self.is_root() and self.fuzzy_matches + self.fuzzy_non_matches > 0:
             print('Matched %d / %d entries (%.1f%%). Updated %d entries for lang %s.' % (self.fuzzy_matches, self.fuzzy_matches + self.fuzzy_non_matches, 100 * self.fuzzy_matches / (self.fuzzy_matches + self.fuzzy_non_matches), self.fuzzy_non_matches, self.lang))
         if self.validate:
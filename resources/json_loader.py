@@ -0,0 +1,84 @@
+"""
+Loads json files concurrently, for validation, where many existing files need to be read and compared.
+
+Files are read in chunks through a bounded thread pool, and results are streamed back in order as soon as they are available. If `orjson` is installed, it is used to decode files, otherwise the standard `json` module is used.
+Also loads and saves the json caches and manifests kept under `.cache/`, with `load_json_cache()` and `save_json_cache()`.
+
+"""
+
+import json
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Any, Iterable, Iterator, Tuple, Deque, Callable, List
+
+try:
+    import orjson
+    decode = orjson.loads
+except ImportError:
+    orjson = None
+    decode = json.loads
+
+THREADS = 8
+CHUNK_SIZE = 64  # The number of files loaded by each task, as one task per file has a large overhead compared to reading a small file
+MAX_IN_FLIGHT = 16  # The maximum number of tasks running ahead of the consumer
+
+
+def load(path: str) -> Any:
+    with open(path, 'rb') as f:
+        return decode(f.read())
+
+
+def load_if_present(path: str) -> Any:
+    """ Loads a json file, or returns `None` if it does not exist """
+    if os.path.isfile(path):
+        return load(path)
+    return None
+
+
+def load_json_cache(path: str, default: Any = None) -> Any:
+    """ Loads a json cache or manifest, or returns `default` if it does not exist or can't be read, in which case it will be rebuilt """
+    if os.path.isfile(path):
+        try:
+            return load(path)
+        except ValueError as e:
+            print('Failed to read cache at %s: %s' % (path, e))
+    return default
+
+
+def save_json_cache(path: str, data: Any):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+
+
+def load_all(paths: Iterable[str], load_path: Callable[[str], Any] = load) -> Iterator[Tuple[str, Any]]:
+    """
+    Loads json files concurrently, in chunks, yielding each path and its data in the same order as `paths`, as soon as its chunk has been loaded.
+    :param load_path: The function used to load each file, i.e. `load_if_present` to allow missing files.
+    """
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        pending: Deque[Tuple[List[str], Future]] = deque()
+        for chunk in chunks(paths):
+            pending.append((chunk, pool.submit(load_chunk, load_path, chunk)))
+            if len(pending) >= MAX_IN_FLIGHT:
+                chunk, future = pending.popleft()
+                yield from zip(chunk, future.result())
+        while pending:
+            chunk, future = pending.popleft()
+            yield from zip(chunk, future.result())
+
+
+def load_chunk(load_path: Callable[[str], Any], chunk: List[str]) -> List[Any]:
+    return [load_path(path) for path in chunk]
+
+
+def chunks(paths: Iterable[str]) -> Iterator[List[str]]:
+    chunk = []
+    for path in paths:
+        chunk.append(path)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -1,11 +1,12 @@
-import json
+import hashlib
 import os
 import re
-from typing import NamedTuple, Tuple, List, Mapping, Set, Any, Dict
+from typing import NamedTuple, Tuple, List, Mapping, Set, Any, Dict, Callable, Sequence
 
 from mcresources import ResourceManager, utils
 from mcresources.type_definitions import JsonObject, ResourceLocation, ResourceIdentifier
 
+import json_loader
 from constants import ROCK_CATEGORIES, ALLOYS, lang
 from i18n import I18n
 
@@ -14,6 +15,9 @@ PAGE_BREAK = 'page_break'
 EMPTY_LAST_PAGE = 'empty_last_page'
 TABLE_PAGE = 'table'
 TABLE_PAGE_SMALL = 'table_small'
+# Manifests of the hash of each written category and entry, along with the size and modification time of the file it was written to, per language
+BOOK_MANIFEST_DIR = './.cache/book'
+LINK_PATTERN = re.compile(r'\$\(l:([^)]*)\)')  # Internal links, of the form $(l:category/entry) or $(l:category/entry#anchor)
 TABLE_KEYS = {'strings': '#strings', 'columns': '#columns', 'first_column_width': '#first_column_width', 'column_width': '#column_width', 'row_height': '#row_height', 'left_buffer': '#left_buffer', 'top_buffer': '#top_buffer', 'title': '#title', 'legend': '#legend', 'draw_background': '#draw_background'}
 
 
@@ -56,17 +60,20 @@ class Page(NamedTuple):
             self.link_ids.append(link_id)
         return self
 
-    def translate(self, i18n: I18n):
+    def translate(self, i18n: I18n) -> JsonObject:
+        """ Returns the data of this page with all translatable text translated. The page itself is left untranslated, so it can be translated again into other languages. """
+        data = dict(self.data)
         for key in self.translation_keys:
-            if key in self.data and self.data[key] is not None:
-                value = self.data[key]
+            if key in data and data[key] is not None:
+                value = data[key]
                 if isinstance(value, SubstitutionStr):
                     try:
-                        self.data[key] = i18n.translate(value.value).format(*value.params)
+                        data[key] = i18n.translate(value.value).format(*value.params)
                     except IndexError as e:
                         raise ValueError('Error performing replacement for lang %s\n  \'%s\' -> \'%s\'' % (i18n.lang, value.value, i18n.translate(value.value))) from e
                 else:
-                    self.data[key] = i18n.translate(value)
+                    data[key] = i18n.translate(value)
+        return data
 
     def iter_all_text(self):
         for key in self.translation_keys:
@@ -92,83 +99,93 @@ class Category(NamedTuple):
     entries: Tuple[Entry, ...]
 
 
+class ResolvedEntry(NamedTuple):
+    entry_id: str
+    name: str
+    icon: str
+    pages: Tuple[Page, ...]  # The pages as written, excluding markers, and including blank pages after tables
+    advancement: str | None
+    sortnum: int | None
+    extra_recipe_mappings: Dict[str, int] | None
+
+
 class Book:
 
-    def __init__(self, rm: ResourceManager, root_name: str, macros: JsonObject, i18n: I18n, local_instance: bool, reverse_translate: bool):
-        self.rm: ResourceManager = rm
+    def __init__(self, root_name: str, macros: JsonObject, local_instance: bool):
         self.root_name = root_name
-        self.category_count = 0
-        self.i18n = i18n
         self.local_instance = local_instance
-        self.reverse_translate = reverse_translate
 
-        self.categories: List[Category] = []
+        self.templates: List[Tuple[str, Tuple[Component, ...]]] = []
+        self.category_ids: List[str] = []  # All categories, in order
+        self.builders: Dict[str, Callable[[], Category]] = {}  # Builders of categories which have not been built yet, by id
+        self.categories: Dict[str, Category] = {}  # Categories which have been built, by id
+        self.entries: Dict[str, List[ResolvedEntry]] | None = None  # Entries by category id, for each category being written, once resolved
+        self.link_targets: Dict[str, Dict[str, Set[str]]] = {}  # Anchors of each entry by entry id, by category id, for each category which has been linked to
         self.macros = macros
 
     def template(self, template_id: str, *components: Component):
-        if self.i18n.is_root():  # Templates are only required in root
-            self.rm.data(('patchouli_books', self.root_name, self.i18n.lang, 'templates', template_id), {
-                'components': [{
-                    'type': c.type, 'x': c.x, 'y': c.y, **c.data
-                } for c in components]
-            }, root_domain='assets')
+        self.templates.append((template_id, components))
 
     def category(self, category_id: str, name: str, description: str, icon: str, parent: str | None = None, is_sorted: bool = False, entries: Tuple[Entry, ...] = ()):
+        """ Adds a category, see `category()` """
+        self.category_ids.append(category_id)
+        self.categories[category_id] = category(category_id, name, description, icon, parent, is_sorted, entries)
+
+    def lazy_category(self, category_id: str, builder: Callable[[], Category]):
+        """ Adds a category, which is only built by calling `builder` when it is first needed, i.e. if it is being written, or another category links to it """
+        self.category_ids.append(category_id)
+        self.builders[category_id] = builder
+
+    def category_of(self, category_id: str) -> Category:
+        if category_id not in self.categories:
+            c = self.builders.pop(category_id)()
+            assert c.category_id == category_id, 'Category \'%s\' was built with a different id: \'%s\'' % (category_id, c.category_id)
+            self.categories[category_id] = c
+        return self.categories[category_id]
+
+    def resolve(self, category_ids: Sequence[str] | None = None):
         """
-        :param category_id: The id of this category.
-        :param name: The name of this category.
-        :param description: The description for this category. This displays in the category's main page, and can be formatted.
-        :param icon: The icon for this category. This can either be an ItemStack String, if you want an item to be the icon, or a resource location pointing to a square texture. If you want to use a resource location, make sure to end it with .png.
-        :param parent: The parent category to this one. If this is a sub-category, simply put the name of the category this is a child to here. If not, don't define it. This should be fully-qualified and of the form domain:name where domain is the same as the domain of your Book ID.
-        :param is_sorted: If the entries within this category are sorted
-        :param entries: A list of entries (call entry() for each)
-
-        https://vazkiimods.github.io/Patchouli/docs/reference/category-json/
+        Validates the pages and links of all entries, and resolves the pages that will be written. This is independent of the language, so it only needs to be done once per book, and is not repeated when building each language.
+        :param category_ids: If present, only these categories are built, validated and written. Other categories are only built if they are linked to, in order to validate links to them.
         """
-        self.categories.append(Category(category_id, name, description, icon, parent, is_sorted, entries))
-
-    def build(self):
-        # Only generate the book.json if we're in the root language
-        if self.i18n.lang == 'en_us':
-            self.rm.data(('patchouli_books', self.root_name, 'book'), {
-                'name': 'tfc.field_guide.book_name',
-                'landing_text': 'tfc.field_guide.book_landing_text',
-                'subtitle': '${version}',
-                # Even though we don't use the book item, we still need patchy to make a book item for us, as it controls the title
-                # If neither we nor patchy make a book item, this will show up as 'Air'. So we make one to allow the title to work properly.
-                'dont_generate_book': False,
-                'show_progress': False,
-                'macros': self.macros,
-                'use_resource_pack': not self.local_instance,  # Required since 1.20 for mod books
-            })
-
-        # Find all valid link targets
-        link_targets = {}
-        for c in self.categories:
-            for e in c.entries:
-                link_targets['%s/%s' % (c.category_id, e.entry_id)] = {p.anchor_id for p in e.pages if p.anchor_id is not None}
-
-        for c in self.categories:
-            self.build_category(link_targets, c.category_id, c.name, c.description, c.icon, c.parent, c.is_sorted, c.entries)
-
-    def build_category(self, link_targets: Mapping[str, Set[str]], category_id: str, name: str, description: str, icon: str, parent: str | None, is_sorted: bool, entries: Tuple[Entry, ...]):
-        if self.reverse_translate:
-            data = self.load_data(('patchouli_books', self.root_name, self.i18n.lang, 'categories', category_id))
-            self.i18n.after[name] = data['name']
-            self.i18n.after[description] = data['description']
-        else:
-            self.rm.data(('patchouli_books', self.root_name, self.i18n.lang, 'categories', category_id), {
-                'name': self.i18n.translate(name),
-                'description': self.i18n.translate(description),
-                'icon': icon,
-                'parent': parent,
-                'sortnum': self.category_count,
-            }, root_domain='assets')
-        self.category_count += 1
-
-        category_res: ResourceLocation = utils.resource_location(self.rm.domain, category_id)
-
+        for category_id in category_ids or ():
+            assert category_id in self.category_ids, 'Unknown book category: \'%s\', expected one of: %s' % (category_id, ', '.join(self.category_ids))
+
+        self.entries = {}
+        for category_id in self.category_ids:
+            if category_ids is None or category_id in category_ids:
+                c = self.category_of(category_id)
+                self.entries[category_id] = self.resolve_category(c.entries, c.is_sorted)
+
+        broken_links = [error for entries in self.entries.values() for e in entries for error in self.find_broken_links(e)]
+        assert not broken_links, 'Found %d broken links:\n%s' % (len(broken_links), '\n'.join(broken_links))
+
+    def find_broken_links(self, e: ResolvedEntry) -> List[str]:
+        """ Validates all internal links of the form $(l:...) in an entry, returning an error for each broken link """
+        errors = []
+        for p in e.pages:
+            for page_text in p.iter_all_text():
+                for key in LINK_PATTERN.findall(page_text):
+                    if key.startswith('http'):
+                        continue  # Don't validate external links
+                    target, sep, anchor = key.partition('#')
+                    category_id, _, entry_id = target.rpartition('/')
+                    anchors = self.link_targets_of(category_id).get(entry_id) if category_id in self.category_ids else None
+                    if anchors is None:
+                        errors.append('Link target \'%s\' not found for link \'%s\'\n  at page: %s\n  at entry: \'%s\'' % (target, key, p, e.entry_id))
+                    elif sep and anchor not in anchors:
+                        errors.append('Link anchor \'%s\' not found for link \'%s\'\n  at page: %s\n  at entry: \'%s\'' % (anchor, key, p, e.entry_id))
+        return errors
+
+    def link_targets_of(self, category_id: str) -> Dict[str, Set[str]]:
+        """ The anchors of each entry in a category, by entry id. This builds the category if needed, so links to categories which are not being written can still be validated. """
+        if category_id not in self.link_targets:
+            self.link_targets[category_id] = {e.entry_id: {p.anchor_id for p in e.pages if p.anchor_id is not None} for e in self.category_of(category_id).entries}
+        return self.link_targets[category_id]
+
+    def resolve_category(self, entries: Tuple[Entry, ...], is_sorted: bool) -> List[ResolvedEntry]:
         assert not isinstance(entries, Entry), 'One entry in singleton entries, did you forget a comma after entry(), ?\n  at: %s' % str(entries)
+        resolved = []
         for i, e in enumerate(entries):
             assert not isinstance(e.pages, Page), 'One entry in singleton pages, did you forget a comma after page(), ?\n  at: %s' % str(e.pages)
             assert len(e.pages) > 0, 'Entry must have at least one page!\n  at: %s' % str(e.name)
@@ -215,65 +232,164 @@ class Book:
                     assert link not in seen_links, 'Duplicate link "%s" on page %s' % (link, p)
                     seen_links.add(link)
 
-            # Validate all internal links of the form $(l:...)
-            for p in real_pages:
-                for page_text in p.iter_all_text():
-                    for match in re.finditer(r'\$\(l:([^)]*)\)', page_text):
-                        key = match.group(1)
-                        if key.startswith('http'):
-                            continue  # Don't validate external links
-                        if '#' in key:
-                            target, anchor = key.split('#')
-                        else:
-                            target, anchor = key, None
-                        assert target in link_targets, 'Link target \'%s\' not found for link \'%s\'\n  at page: %s\n  at entry: \'%s\'' % (target, key, p, e.entry_id)
-                        if anchor is not None:
-                            assert anchor in link_targets[target], 'Link anchor \'%s\' not found for link \'%s\'\n  at page: %s\n  at entry: \'%s\'' % (anchor, key, p, e.entry_id)
+            resolved.append(ResolvedEntry(e.entry_id, e.name, e.icon, tuple(real_pages), e.advancement, i if is_sorted else None, extra_recipe_mappings))
+        return resolved
+
+    def build(self, rm: ResourceManager, i18n: I18n, reverse_translate: bool = False, use_manifest: bool = False):
+        """
+        Translates and writes the book for a single language
+        :param use_manifest: If true, categories and entries which are unchanged since they were last written, according to the manifest for this language, are skipped entirely.
+        """
+        if self.entries is None:
+            self.resolve()
 
+        # Only generate the book.json and templates if we're in the root language
+        if i18n.is_root():
+            rm.data(('patchouli_books', self.root_name, 'book'), {
+                'name': 'tfc.field_guide.book_name',
+                'landing_text': 'tfc.field_guide.book_landing_text',
+                'subtitle': '${version}',
+                # Even though we don't use the book item, we still need patchy to make a book item for us, as it controls the title
+                # If neither we nor patchy make a book item, this will show up as 'Air'. So we make one to allow the title to work properly.
+                'dont_generate_book': False,
+                'show_progress': False,
+                'macros': self.macros,
+                'use_resource_pack': not self.local_instance,  # Required since 1.20 for mod books
+            })
+            for template_id, components in self.templates:
+                rm.data(('patchouli_books', self.root_name, i18n.lang, 'templates', template_id), {
+                    'components': [{
+                        'type': c.type, 'x': c.x, 'y': c.y, **c.data
+                    } for c in components]
+                }, root_domain='assets')
+
+        reverse_data = self.load_reverse_data(rm, i18n) if reverse_translate else None
+        manifest = load_book_manifest(i18n.lang) if use_manifest and not reverse_translate else None
+        skipped = 0
+        for sortnum, category_id in enumerate(self.category_ids):
+            if category_id in self.entries:
+                skipped += self.build_category(rm, i18n, reverse_data, manifest, sortnum, self.category_of(category_id))
+
+        if manifest is not None:
+            save_book_manifest(i18n.lang, manifest)
+            print('Skipped %d / %d unchanged categories and entries for lang %s' % (skipped, len(self.entries) + sum(map(len, self.entries.values())), i18n.lang))
+
+    def build_category(self, rm: ResourceManager, i18n: I18n, reverse_data: Dict[Tuple[str, ...], JsonObject] | None, manifest: Dict[str, List] | None, sortnum: int, c: Category) -> int:
+        """ Returns the number of unchanged files which were skipped """
+        skipped = 0
+        if reverse_data is not None:
+            data = reverse_data[('patchouli_books', self.root_name, i18n.lang, 'categories', c.category_id)]
+            i18n.after[c.name] = data['name']
+            i18n.after[c.description] = data['description']
+        else:
+            skipped += self.write_data(rm, manifest, ('patchouli_books', self.root_name, i18n.lang, 'categories', c.category_id), {
+                'name': i18n.translate(c.name),
+                'description': i18n.translate(c.description),
+                'icon': c.icon,
+                'parent': c.parent,
+                'sortnum': sortnum,
+            })
+
+        category_res: ResourceLocation = utils.resource_location(rm.domain, c.category_id)
+
+        for e in self.entries[c.category_id]:
             # Separately translate each page
-            if self.reverse_translate:
-                rev_entry = self.load_data(('patchouli_books', self.root_name, self.i18n.lang, 'entries', category_res.path, e.entry_id))
+            if reverse_data is not None:
+                rev_entry = reverse_data[('patchouli_books', self.root_name, i18n.lang, 'entries', category_res.path, e.entry_id)]
                 if rev_entry:
                     rev_pages = rev_entry['pages']
-                    for p, rp in zip(real_pages, rev_pages):
+                    for p, rp in zip(e.pages, rev_pages):
                         for key in p.translation_keys:
                             if key in p.data and p.data[key] is not None and key in rp:
-                                self.i18n.after[str(p.data[key])] = rp[key]
+                                i18n.after[str(p.data[key])] = rp[key]
 
-                    self.i18n.after[e.name] = rev_entry['name']
+                    i18n.after[e.name] = rev_entry['name']
                 else:
                     print('Warning: missing book entry: %s/%s' % (category_res.path, e.entry_id))
                 continue
 
-            entry_name = self.i18n.translate(e.name)
-            for p in real_pages:
-                p.translate(self.i18n)
+            entry_name = i18n.translate(e.name)
+            pages_data = [p.translate(i18n) for p in e.pages]
 
-            self.rm.data(('patchouli_books', self.root_name, self.i18n.lang, 'entries', category_res.path, e.entry_id), {
+            skipped += self.write_data(rm, manifest, ('patchouli_books', self.root_name, i18n.lang, 'entries', category_res.path, e.entry_id), {
                 'name': entry_name,
                 'category': self.prefix(category_res.path),
                 'icon': e.icon,
                 'pages': [{
                     'type': self.prefix(p.type) if p.custom else p.type,
                     'anchor': p.anchor_id,
-                    **p.data
-                } for p in real_pages],
+                    **data
+                } for p, data in zip(e.pages, pages_data)],
                 'advancement': e.advancement,
                 'read_by_default': True,
-                'sortnum': i if is_sorted else None,
-                'extra_recipe_mappings': extra_recipe_mappings
-            }, root_domain='assets')
+                'sortnum': e.sortnum,
+                'extra_recipe_mappings': e.extra_recipe_mappings
+            })
+        return skipped
+
+    @staticmethod
+    def write_data(rm: ResourceManager, manifest: Dict[str, List] | None, name_parts: ResourceIdentifier, data_in: JsonObject) -> bool:
+        """ Writes a book asset, unless the manifest records identical data was written to the same, unmodified, file. Returns true if the write was skipped. """
+        if manifest is None:
+            rm.data(name_parts, data_in, root_domain='assets')
+            return False
+
+        res = utils.resource_location(rm.domain, name_parts)
+        path = os.path.join(*rm.resource_dir, 'assets', res.domain, res.path) + '.json'
+        digest = hashlib.sha256(repr(data_in).encode('utf-8')).hexdigest()
+        entry = manifest.get(path)
+        if entry is not None and entry[0] == digest and os.path.isfile(path):
+            stat = os.stat(path)
+            if entry[1:] == [stat.st_size, stat.st_mtime_ns]:
+                return True
+
+        rm.data(name_parts, data_in, root_domain='assets')
+        if os.path.isfile(path):
+            stat = os.stat(path)
+            manifest[path] = [digest, stat.st_size, stat.st_mtime_ns]
+        return False
 
     def prefix(self, path: str) -> str:
         """ In a local instance, domains are all under patchouli, otherwise under tfc """
         return ('patchouli' if self.local_instance else 'tfc') + ':' + path
 
-    def load_data(self, name_parts: ResourceIdentifier) -> JsonObject:
-        res = utils.resource_location(self.rm.domain, name_parts)
-        path = os.path.join(*self.rm.resource_dir, 'data', res.domain, res.path) + '.json'
-        if os.path.isfile(path):
-            with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+    def load_reverse_data(self, rm: ResourceManager, i18n: I18n) -> Dict[Tuple[str, ...], JsonObject]:
+        """ Loads all existing categories and entries of the book in a language, concurrently, to be reverse translated. Missing files are loaded as `None` """
+        all_name_parts = []
+        for category_id, entries in self.entries.items():
+            category_res: ResourceLocation = utils.resource_location(rm.domain, category_id)
+            all_name_parts.append(('patchouli_books', self.root_name, i18n.lang, 'categories', category_id))
+            all_name_parts += [('patchouli_books', self.root_name, i18n.lang, 'entries', category_res.path, e.entry_id) for e in entries]
+        paths = [self.data_path(rm, name_parts) for name_parts in all_name_parts]
+        return {name_parts: data for name_parts, (_, data) in zip(all_name_parts, json_loader.load_all(paths, json_loader.load_if_present))}
+
+    @staticmethod
+    def data_path(rm: ResourceManager, name_parts: ResourceIdentifier) -> str:
+        res = utils.resource_location(rm.domain, name_parts)
+        return os.path.join(*rm.resource_dir, 'data', res.domain, res.path) + '.json'
+
+
+def load_book_manifest(lang: str) -> Dict[str, List]:
+    return json_loader.load_json_cache(os.path.join(BOOK_MANIFEST_DIR, '%s.json' % lang), {})
+
+
+def save_book_manifest(lang: str, manifest: Dict[str, List]):
+    json_loader.save_json_cache(os.path.join(BOOK_MANIFEST_DIR, '%s.json' % lang), manifest)
+
+
+def category(category_id: str, name: str, description: str, icon: str, parent: str | None = None, is_sorted: bool = False, entries: Tuple[Entry, ...] = ()) -> Category:
+    """
+    :param category_id: The id of this category.
+    :param name: The name of this category.
+    :param description: The description for this category. This displays in the category's main page, and can be formatted.
+    :param icon: The icon for this category. This can either be an ItemStack String, if you want an item to be the icon, or a resource location pointing to a square texture. If you want to use a resource location, make sure to end it with .png.
+    :param parent: The parent category to this one. If this is a sub-category, simply put the name of the category this is a child to here. If not, don't define it. This should be fully-qualified and of the form domain:name where domain is the same as the domain of your Book ID.
+    :param is_sorted: If the entries within this category are sorted
+    :param entries: A list of entries (call entry() for each)
+
+    https://vazkiimods.github.io/Patchouli/docs/reference/category-json/
+    """
+    return Category(category_id, name, description, icon, parent, is_sorted, entries)
 
 
 def entry(entry_id: str, name: str, icon: str, advancement: str | None = None, pages: Tuple[Page, ...] = ()) -> Entry:
@@ -0,0 +1,270 @@
+"""
+Resource managers used by resource generation, and running generators in isolation from each other.
+
+`ValidatingResourceManager` and `BufferedResourceManager` buffer written files, to validate or write them all at once. `generate_isolated_all()` runs each generator against its own resource manager, in a separate process with `--jobs`, and merges the results as if they had run serially.
+These live outside of `__main__`, so they can be pickled by reference, and imported by worker processes regardless of the multiprocessing start method.
+
+"""
+
+import difflib
+import functools
+import json
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, NamedTuple, Callable, Dict, List, Sequence, Set, Tuple
+
+from mcresources import ResourceManager, utils
+from mcresources.tag import Tag
+from mcresources.type_definitions import ResourceLocation, JsonObject
+
+import build_cache
+import json_loader
+
+WRITE_THREADS = 8  # The number of threads used by BufferedResourceManager
+
+
+class GeneratedResources(NamedTuple):
+    """ The output of a single generator run against its own resource manager: buffered lang and tag entries, written files, and write statistics """
+    lang: Dict[str, Dict[str, str]]
+    tags: Dict[str, Dict[ResourceLocation, Tag]]
+    replaced: Dict[str, Dict[ResourceLocation, bool]]  # The last explicit `replace` set on each tag, if any
+    files: List[str]
+    elapsed: float
+    new_files: int
+    modified_files: int
+    unchanged_files: int
+    error_files: int
+
+
+def generate_isolated_all(rm: ResourceManager, generators: List[Callable[[ResourceManager], None]], jobs: int, cache: build_cache.BuildCache | None):
+    """
+    Runs each generator against a separate resource manager, then merges the results into `rm` in the same order as running them serially.
+    With `jobs > 1`, generators are run in separate processes. With a `cache`, generators which are unchanged since the last run are skipped.
+    """
+    results: Dict[Callable[[ResourceManager], None], GeneratedResources] = {}
+    pending = []
+    for generate in generators:
+        entry = cache.load(generate) if cache is not None else None
+        if entry is not None:
+            # Nothing is written, so count all previously generated files as unchanged
+            results[generate] = entry.result._replace(new_files=0, modified_files=0, unchanged_files=len(entry.files))
+        else:
+            pending.append(generate)
+
+    if jobs > 1 and len(pending) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futures = {generate: pool.submit(generate_isolated, factory_of(rm), rm.domain, rm.resource_dir, generate) for generate in pending}
+            for generate, future in futures.items():
+                results[generate] = future.result()
+    else:
+        for generate in pending:
+            results[generate] = generate_isolated(factory_of(rm), rm.domain, rm.resource_dir, generate)
+
+    if cache is not None:
+        for generate in pending:
+            result = results[generate]
+            if result.error_files == 0:
+                print('Generated %s in %.2fs' % (build_cache.name_of(generate), result.elapsed))
+                cache.save(generate, result.files, result, result.elapsed)
+
+    for generate in generators:
+        merge_generated(rm, results[generate])
+
+
+def generate_isolated(rm_factory: Callable[[str, Sequence[str]], ResourceManager], domain: str, resource_dir: Sequence[str], generate: Callable[[ResourceManager], None]) -> GeneratedResources:
+    """ Runs a single generator against a new resource manager. Files are written directly, while lang and tag entries are returned to be merged. """
+    start = time.perf_counter()
+    rm = rm_factory(domain, resource_dir)
+    files = []
+    replaced: Dict[str, Dict[ResourceLocation, bool]] = defaultdict(dict)
+    write, tag = rm.write, rm.tag
+
+    def recording_write(path_parts: Sequence[str], data_in):
+        files.append(os.path.join(*path_parts) + '.json')
+        write(path_parts, data_in)
+
+    def recording_tag(name_parts, root_domain, *values, replace: bool = None):
+        if replace is not None:
+            replaced['/'.join(utils.str_path(root_domain))][utils.resource_location(rm.domain, name_parts)] = replace
+        tag(name_parts, root_domain, *values, replace=replace)
+
+    rm.write = recording_write
+    rm.tag = recording_tag
+    generate(rm)
+    if isinstance(rm, BufferedResourceManager):
+        rm.write_buffered()
+    elif isinstance(rm, ValidatingResourceManager):
+        rm.validate_buffered()
+    return GeneratedResources(dict(rm.lang_buffer), dict(rm.tags_buffer), dict(replaced), files, time.perf_counter() - start, rm.new_files, rm.modified_files, rm.unchanged_files, rm.error_files)
+
+
+def factory_of(rm: ResourceManager) -> Callable[[str, Sequence[str]], ResourceManager]:
+    """ A picklable factory for a new resource manager of the same type as `rm` """
+    if isinstance(rm, BufferedResourceManager):
+        return functools.partial(BufferedResourceManager, mirror_dirs=rm.mirror_dirs)
+    return type(rm)
+
+
+def merge_generated(rm: ResourceManager, result: GeneratedResources):
+    # Updating in order keeps both the position of the first insertion, and the value of the last, for each lang key - identical to a serial run
+    for language, entries in result.lang.items():
+        rm.lang_buffer[language].update(entries)
+    # As in `ResourceManager.tag()`, a tag keeps the `replace` it was created with, unless a later generator explicitly sets it
+    for tag_type, tags_in in result.tags.items():
+        for tag_res, tag in tags_in.items():
+            if tag_res in rm.tags_buffer[tag_type]:
+                existing = rm.tags_buffer[tag_type][tag_res]
+                existing.add_all(tag.values)
+                if tag_res in result.replaced.get(tag_type, ()):
+                    existing.replace = result.replaced[tag_type][tag_res]
+            else:
+                rm.tags_buffer[tag_type][tag_res] = tag
+
+    rm.new_files += result.new_files
+    rm.modified_files += result.modified_files
+    rm.unchanged_files += result.unchanged_files
+    rm.error_files += result.error_files
+
+
+class ValidatingResourceManager(ResourceManager):
+    """
+    A resource manager which validates generated files against the existing files, rather than writing them.
+    Existing files are found with a single snapshot of the resource directory, taken on the first write, rather than checking each file individually.
+    Written files are buffered until `validate_buffered()` is called, when the existing files are loaded concurrently, with `json_loader`, and compared.
+    """
+
+    def __init__(self, domain: str, resource_dir):
+        super(ValidatingResourceManager, self).__init__(domain, resource_dir)
+        self.validation_error = False
+        self.snapshot_root = os.path.normpath(os.path.join(*self.resource_dir))
+        self.snapshot: Set[str] | None = None  # Paths of all existing json files
+        self.buffer: List[Tuple[str, JsonObject]] = []  # Paths and data of written files which have not been validated yet
+
+    def write(self, path_parts, data_to_write):
+        data_to_write = del_none({'__comment__': 'This file was automatically created by mcresources', **data_to_write})
+        path = os.path.join(*path_parts) + '.json'
+        try:
+            if not self.exists(path):
+                print('Error: resource generation created new file \'%s\'' % path, file=sys.stderr)
+                self.error_files += 1
+                return
+        except Exception as e:
+            self.on_error(path, e)
+            self.error_files += 1
+            return
+        self.buffer.append((path, data_to_write))
+
+    def validate_buffered(self):
+        """ Validates, and clears, all buffered files """
+        buffer, self.buffer = self.buffer, []
+        for (path, old_data), (_, data_to_write) in zip(json_loader.load_all((path for path, _ in buffer), load_or_error), buffer):
+            if isinstance(old_data, Exception):
+                self.on_error(path, old_data)
+                self.error_files += 1
+            elif old_data != data_to_write:
+                old_text = json.dumps(old_data, indent=self.indent)
+                text = json.dumps(data_to_write, indent=self.indent)
+                diff = '\n'.join(difflib.unified_diff(old_text.split('\n'), text.split('\n'), 'old', 'new', n=1))
+                print('Error: resource generation modified file \'%s\' Diff:\n%s\n' % (path, diff), file=sys.stderr)
+                self.error_files += 1
+
+    def exists(self, path: str) -> bool:
+        path = os.path.normpath(path)
+        if not path.startswith(self.snapshot_root + os.sep):
+            return os.path.isfile(path)
+        if self.snapshot is None:
+            self.snapshot = snapshot_json_files(self.snapshot_root)
+        return path in self.snapshot
+
+
+class BufferedResourceManager(ResourceManager):
+    """
+    A resource manager which buffers all written files in memory, until `write_buffered()` is called.
+    Files are then written to the resource directory, and to each of `mirror_dirs`, through a bounded thread pool. Unchanged files are skipped, and each file is serialized at most once, no matter how many directories it is written to.
+    """
+
+    def __init__(self, domain: str, resource_dir, mirror_dirs: Sequence[Sequence[str] | str] = ()):
+        super(BufferedResourceManager, self).__init__(domain, resource_dir)
+        self.mirror_dirs = [utils.str_path(d) for d in mirror_dirs]
+        self.buffer: Dict[Tuple[str, ...], JsonObject] = {}  # Path parts relative to the resource directory, mapped to data
+
+    def write(self, path_parts, data_to_write):
+        root = len(self.resource_dir)
+        if tuple(path_parts[:root]) != tuple(self.resource_dir):
+            return super(BufferedResourceManager, self).write(path_parts, data_to_write)  # Outside the resource directory, so not buffered
+        self.buffer[tuple(path_parts[root:])] = del_none({'__comment__': 'This file was automatically created by mcresources', **data_to_write})
+
+    def write_buffered(self):
+        """ Writes, and clears, all buffered files """
+        roots = [self.resource_dir, *self.mirror_dirs]
+        snapshots = [snapshot_json_files(os.path.normpath(os.path.join(*root))) for root in roots]
+        stats = [[0] * len(utils.WriteFlag) for _ in roots]
+        with ThreadPoolExecutor(max_workers=WRITE_THREADS) as pool:
+            for flags in pool.map(lambda item: self.write_to_all(roots, snapshots, *item), self.buffer.items()):
+                for i, flag in enumerate(flags):
+                    stats[i][flag - 1] += 1
+        self.buffer.clear()
+
+        self.new_files, self.modified_files, self.unchanged_files, self.error_files = (self.new_files + stats[0][0], self.modified_files + stats[0][1], self.unchanged_files + stats[0][2], self.error_files + stats[0][3])
+        for root, (new, modified, unchanged, errors) in zip(self.mirror_dirs, stats[1:]):
+            print('Mirrored to %s: New = %d, Modified = %d, Unchanged = %d, Errors = %d' % (os.path.join(*root), new, modified, unchanged, errors))
+
+    def write_to_all(self, roots: List[Sequence[str]], snapshots: List[Set[str]], rel_parts: Tuple[str, ...], data_to_write: JsonObject) -> List[utils.WriteFlag]:
+        flags = []
+        text = None
+        for root, existing in zip(roots, snapshots):
+            path = os.path.join(*root, *rel_parts) + '.json'
+            try:
+                exists = os.path.normpath(path) in existing
+                if exists:
+                    with open(path, 'rb') as file:
+                        if json.loads(file.read()) == data_to_write:
+                            flags.append(utils.WriteFlag.UNCHANGED)
+                            continue
+                else:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                if text is None:
+                    text = json.dumps(data_to_write, indent=self.indent, ensure_ascii=self.ensure_ascii)
+                with open(path, 'w', encoding='utf-8') as file:
+                    file.write(text)
+                flags.append(utils.WriteFlag.MODIFIED if exists else utils.WriteFlag.NEW)
+            except Exception as e:
+                self.on_error(path, e)
+                flags.append(utils.WriteFlag.ERROR)
+        return flags
+
+
+def del_none(data_in):
+    """ Equivalent to `utils.del_none()`, but checks against concrete types first, as `isinstance()` checks against `typing` generics are slow """
+    if isinstance(data_in, dict):
+        return {key: del_none(value) for key, value in data_in.items() if value is not None}
+    elif isinstance(data_in, (list, tuple)):
+        return [del_none(p) for p in data_in if p is not None]
+    elif isinstance(data_in, (str, int, float)):
+        return data_in
+    return utils.del_none(data_in)
+
+
+def load_or_error(path: str) -> Any:
+    """ Loads a json file, returning any error instead of raising it, so one invalid file does not stop the rest from being loaded """
+    try:
+        return json_loader.load(path)
+    except Exception as e:
+        return e
+
+
+def snapshot_json_files(root: str) -> Set[str]:
+    """ Finds all json files under `root` in a single pass """
+    files = set()
+    dirs = [root] if os.path.isdir(root) else []
+    while dirs:
+        with os.scandir(dirs.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.append(entry.path)
+                elif entry.name.endswith('.json'):
+                    files.add(os.path.normpath(entry.path))
+    return files
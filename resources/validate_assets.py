@@ -1,9 +1,11 @@
-from glob import glob
-import json
-from typing import List
+import os
+import time
+from typing import List, Set, Dict, Any
 
 from mcresources import utils
 
+import json_loader
+
 ASSETS_PATH = './src/main/resources/assets/'
 TEXTURE_FORGIVENESS_PATHS: List = ['_fluff', 'block/burlap', 'block/powder', 'metal/smooth', 'metal/block', 'block/molten_flow', 'block/paper', 'block/unrefined_paper', 'yellow_bell', 'red_bell', 'green_bell', 'sandstone/side', 'quiver', 'placed_item']
 MODEL_FORGIVENESS_PATHS: List = ['block/jar', 'block/firepit_log_']
@@ -11,22 +13,48 @@ LANG_PATH = ASSETS_PATH + 'tfc/lang/en_us.json'
 SOUNDS_PATH = ASSETS_PATH + 'tfc/sounds.json'
 
 def main():
+    start = time.perf_counter()
     errors = 0
-    model_locations = glob(ASSETS_PATH + 'tfc/models/**/*.json', recursive=True)
-    state_locations = glob(ASSETS_PATH + 'tfc/blockstates/**/*.json', recursive=True)
-    mc_state_locations = glob(ASSETS_PATH + 'minecraft/blockstates/**/*.json', recursive=True)
-    lang_json = load(LANG_PATH)
-    sound_json = load(SOUNDS_PATH)
+    model_locations = find_files(ASSETS_PATH + 'tfc/models/', '.json')
+    state_locations = find_files(ASSETS_PATH + 'tfc/blockstates/', '.json')
+    mc_state_locations = find_files(ASSETS_PATH + 'minecraft/blockstates/', '.json')
+    texture_locations = find_files(ASSETS_PATH + 'tfc/textures/', '.png')
+    model_paths = set(model_locations)
+    texture_paths = set(texture_locations)
+
+    # Each model is loaded once, and shared between validating parents and textures
+    models = dict(json_loader.load_all(model_locations))
+    lang_json = json_loader.load(LANG_PATH)
+    sound_json = json_loader.load(SOUNDS_PATH)
     errors += validate_lang(state_locations, lang_json, sound_json)
-    errors, km = validate_model_parents(model_locations)
-    errors += validate_textures(model_locations)
-    bs_errors, km2 = validate_blockstate_models(state_locations)
-    bs_errors2, km3 = validate_blockstate_models(mc_state_locations)
+    parent_errors, km = validate_model_parents(models, model_paths)
+    errors += parent_errors
+    errors += validate_textures(models, texture_locations, texture_paths)
+    bs_errors, km2 = validate_blockstate_models(state_locations, model_paths)
+    bs_errors2, km3 = validate_blockstate_models(mc_state_locations, model_paths)
     errors += bs_errors
     errors += bs_errors2
     errors += validate_models_used(model_locations, km + km2 + km3)
+    print('Validated assets in %.2fs' % (time.perf_counter() - start))
     assert errors == 0
 
+
+def find_files(path: str, extension: str) -> List[str]:
+    """ Finds all files with an extension under a directory, recursively, in the same order as `glob(path + '**/*' + extension, recursive=True)` """
+    files = []
+    dirs = []
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.startswith('.'):
+                continue
+            if entry.is_dir():
+                dirs.append(entry.path + '/')
+            elif entry.name.endswith(extension):
+                files.append(entry.path)
+    for d in dirs:
+        files += find_files(d, extension)
+    return files
+
 def validate_lang(state_locations, lang_json, sound_json):
     tested = 0
     tested_sound = 0
@@ -53,23 +81,22 @@ def validate_lang(state_locations, lang_json, sound_json):
     print('Lang Validation: %s blocks tested, %s sounds tested, %s errors' % (tested, tested_sound, errors))
     return errors
 
-def validate_blockstate_models(state_locations):
+def validate_blockstate_models(state_locations: List[str], model_paths: Set[str]):
     tested = 0
     errors = 0
     known_models = []
-    for f in state_locations:
-        state_file = load(f)
+    for f, state_file in json_loader.load_all(state_locations):
         if 'variants' in state_file:
             variants = state_file['variants']
             for variant in variants.values():
                 if isinstance(variant, list):  # catches randomized models
                     for v in variant:
                         model = v['model']
-                        tested, errors = find_model_file(f, model, tested, errors, 'Blockstate file %s points to non-existent model: %s')
+                        tested, errors = find_model_file(f, model, tested, errors, 'Blockstate file %s points to non-existent model: %s', model_paths)
                         known_models.append(model)
                 elif 'model' in variant:
                     model = variant['model']
-                    tested, errors = find_model_file(f, model, tested, errors, 'Blockstate file %s points to non-existent model: %s')
+                    tested, errors = find_model_file(f, model, tested, errors, 'Blockstate file %s points to non-existent model: %s', model_paths)
                     known_models.append(model)
         elif 'multipart' in state_file:
             multipart = state_file['multipart']
@@ -80,11 +107,11 @@ def validate_blockstate_models(state_locations):
                         for entry in apply:
                             if 'model' in entry:
                                 model = entry['model']
-                                tested, errors = find_model_file(f, model, tested, errors, 'Blockstate file %s points to non-existent model: %s')
+                                tested, errors = find_model_file(f, model, tested, errors, 'Blockstate file %s points to non-existent model: %s', model_paths)
                                 known_models.append(model)
                     elif 'model' in apply:
                         model = apply['model']
-                        tested, errors = find_model_file(f, model, tested, errors, 'Blockstate file %s points to non-existent model: %s')
+                        tested, errors = find_model_file(f, model, tested, errors, 'Blockstate file %s points to non-existent model: %s', model_paths)
                         known_models.append(model)
     print('Blockstate Validation: Validated %s files, found %s errors' % (tested, errors))
     return errors, known_models
@@ -93,11 +120,11 @@ def validate_blockstate_models(state_locations):
 def validate_models_used(model_locations, known_models):
     tested = 0
     errors = 0
-    fixed_km = []
+    fixed_km = set()
     fixed_ml = [f.replace('\\', '/') for f in model_locations if 'item' not in f]
     for f in known_models:
         res = utils.resource_location(f)
-        fixed_km.append(ASSETS_PATH + 'tfc/models/%s.json' % res.path)
+        fixed_km.add(ASSETS_PATH + 'tfc/models/%s.json' % res.path)
     for f in fixed_ml:
         tested += 1
         forgiven = True
@@ -111,25 +138,24 @@ def validate_models_used(model_locations, known_models):
     print('Unused model validation: Validated %s files, found %s errors' % (tested, errors))
     return errors
 
-def validate_model_parents(model_locations):
+def validate_model_parents(models: Dict[str, Any], model_paths: Set[str]):
     tested = 0
     errors = 0
     known_models = []
-    for f in model_locations:
-        model_file = load(f)
+    for f, model_file in models.items():
         if 'parent' in model_file:
             parent = model_file['parent']
-            tested, errors = find_model_file(f, parent, tested, errors, 'Model parent not found. Model: %s, Parent: %s')
+            tested, errors = find_model_file(f, parent, tested, errors, 'Model parent not found. Model: %s, Parent: %s', model_paths)
             known_models.append(parent)
     print('Parent Validation: Validated %s files, found %s errors' % (tested, errors))
     return errors, known_models
 
-def validate_textures(model_locations):
+def validate_textures(models: Dict[str, Any], texture_locations: List[str], texture_paths: Set[str]):
     tested = 0
     files_tested = 0
     errors = 0
-    existing_textures = []
-    atlas = load(ASSETS_PATH + 'minecraft/atlases/blocks.json')
+    existing_textures = set()
+    atlas = json_loader.load(ASSETS_PATH + 'minecraft/atlases/blocks.json')
     for source in atlas['sources']:
         if source['type'] == 'paletted_permutations':
             for tex in source['textures']:
@@ -137,9 +163,8 @@ def validate_textures(model_locations):
                 for suffix in source['permutations'].keys():
                     model_like_path = tex + '_' + suffix + '.png'
                     path = model_like_path.replace('tfc:', ASSETS_PATH + 'tfc/textures/')
-                    existing_textures.append(path)
-    for f in model_locations:
-        model_file = load(f)
+                    existing_textures.add(path)
+    for f, model_file in models.items():
         if 'textures' in model_file:
             textures = model_file['textures']
             if isinstance(textures, dict):
@@ -151,12 +176,12 @@ def validate_textures(model_locations):
                             tested += 1
                             path = ASSETS_PATH + 'tfc/textures/%s.png' % res.path
                             if path not in existing_textures:
-                                if len(glob(path)) == 0:
+                                if path not in texture_paths:
                                     print('Texture file not found. Name: %s Filepath: %s' % (f, path))
                                     errors += 1
                                 else:
-                                    existing_textures.append(path)
-    for f in glob(ASSETS_PATH + 'tfc/textures/**/*.png', recursive=True):
+                                    existing_textures.add(path)
+    for f in texture_locations:
         f = f.replace('\\', '/')
         if f not in existing_textures and ('block/' in f or 'item/' in f):
             forgiven = False
@@ -170,19 +195,12 @@ def validate_textures(model_locations):
     print('Texture Validation: Verified %s files, %s texture entries, found %s errors' % (files_tested, tested, errors))
     return errors
 
-def find_model_file(file_path: str, initial_path: str, tested: int, errors: int, on_error: str):
+def find_model_file(file_path: str, initial_path: str, tested: int, errors: int, on_error: str, model_paths: Set[str]):
     res = utils.resource_location(initial_path)
     if res.domain == 'tfc':
         tested += 1
         path = ASSETS_PATH + 'tfc/models/%s.json' % res.path
-        found = len(glob(path))
-        if found != 1:
+        if path not in model_paths:
             print(on_error % (file_path, path))
             errors += 1
     return tested, errors
-
-
-def load(fn: str):
-    with open(fn, 'r', encoding='utf-8') as f:
-        return json.load(f)
-
@@ -0,0 +1,291 @@
+"""
+Zips resources into `assets_zipped.zip` and `data_zipped.zip`, for faster loading in dev. See `ZipResources.java`
+
+The resource directory is walked once, and files are classified by their top level directory. Entries are read and compressed across a thread pool, and written in sorted order with fixed timestamps, so the output is deterministic.
+
+Each archive has a manifest, stored in `.cache/zip`, of the source size, modification time and hash of each entry, and where it is in the archive. In incremental mode, only changed entries are compressed and appended to the archive, and a new central directory is written. Once enough of the archive is unreferenced, it is compacted instead, by copying unchanged entries byte-for-byte to a new archive. A compacted archive is identical to one built from scratch.
+
+"""
+
+import hashlib
+import os
+import shutil
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Executor
+from typing import NamedTuple, Dict, List, Callable, Iterable, Iterator, Optional, TypeVar, BinaryIO
+
+import json_loader
+
+RESOURCES_DIR = './src/main/resources'
+HOTSWAP_DIR = './out/production/resources'
+MANIFEST_DIR = './.cache/zip'
+ZIP_TYPES = ('assets', 'data')
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+# Every entry uses the same DOS timestamp, 1980-01-01 00:00:00
+ZIP_TIME = 0
+ZIP_DATE = (1 << 5) | 1
+
+# Archives are compacted when more than this fraction of them would be unreferenced entries
+COMPACT_RATIO = 0.25
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class ZipEntry(NamedTuple):
+    name: str  # The name in the archive, using '/' separators. Directories end with a '/'
+    method: int
+    crc: int
+    size: int  # The uncompressed size
+    data: bytes  # The compressed data
+    mtime_ns: int  # The modification time of the source file
+    digest: str  # A hash of the uncompressed data
+
+
+class ManifestEntry(NamedTuple):
+    size: int
+    mtime_ns: int
+    digest: str
+    method: int
+    crc: int
+    compressed_size: int
+    offset: int  # The offset of the local header in the archive
+
+
+class Manifest(NamedTuple):
+    level: Optional[int]
+    archive_size: int
+    archive_mtime_ns: int
+    directory_offset: int  # The offset of the central directory, which is also the end of the last entry
+    entries: Dict[str, ManifestEntry]
+
+
+def main(level: int | None, incremental: bool = False):
+    """
+    :param level: The zlib compression level, or `None` to store entries uncompressed
+    :param incremental: If true, only entries which have changed since the last run are compressed and written.
+    """
+    start = time.perf_counter()
+    files = find_files(RESOURCES_DIR)
+
+    total_size = 0
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        for zip_type in ZIP_TYPES:
+            path = os.path.join(RESOURCES_DIR, '%s_zipped.zip' % zip_type)
+            names = with_directories(files[zip_type] + ['pack.mcmeta'])
+            total_size += (update_zip if incremental else write_zip)(path, RESOURCES_DIR, names, level, pool)
+
+    rescue_folder('META-INF')
+    rescue_folder('data/tfc/patchouli_books')
+    rescue_asset('tfc.mixins.json')
+    rescue_asset('assets_zipped.zip')
+    rescue_asset('data_zipped.zip')
+
+    elapsed = time.perf_counter() - start
+    print('Zipped %d asset files, %d data files (%s): %.1f MB in %.2fs (%.1f MB/s)' % (len(files['assets']), len(files['data']), 'stored' if level is None else 'level %d' % level, total_size / 1e6, elapsed, total_size / 1e6 / elapsed))
+
+
+def find_files(root: str) -> Dict[str, List[str]]:
+    """ Walks `root` once, and returns all files under each of `ZIP_TYPES`, as '/' separated paths relative to `root` """
+    files = {zip_type: [] for zip_type in ZIP_TYPES}
+    for zip_type in ZIP_TYPES:
+        for dirpath, _, filenames in os.walk(os.path.join(root, zip_type)):
+            prefix = os.path.relpath(dirpath, root).replace(os.sep, '/')
+            files[zip_type] += [prefix + '/' + fn for fn in filenames]
+    return files
+
+
+def with_directories(files: List[str]) -> List[str]:
+    """ Returns `files`, along with all their parent directories, in sorted order """
+    names = set(files)
+    for name in files:
+        i = name.rfind('/')
+        while i > 0 and name[:i + 1] not in names:
+            names.add(name[:i + 1])
+            i = name.rfind('/', 0, i)
+    return sorted(names)
+
+
+def write_zip(path: str, root: str, names: List[str], level: int | None, pool: Executor) -> int:
+    """
+    Writes a zip file containing `names`, in order, and saves its manifest.
+    :return: The total uncompressed size of all entries
+    """
+    entries = {}
+    with open(path, 'wb') as f:
+        for entry in map_bounded(pool, lambda n: read_entry(root, n, level), names, 4 * (os.cpu_count() or 1)):
+            entries[entry.name] = write_entry(f, entry, path)
+        directory_offset = write_central_directory(f, entries, path)
+    save_manifest(path, level, directory_offset, entries)
+    return sum(e.size for e in entries.values())
+
+
+def update_zip(path: str, root: str, names: List[str], level: int | None, pool: Executor) -> int:
+    """
+    Updates a zip file to contain `names`, using its manifest to only write entries which have changed.
+    Falls back to writing the zip from scratch, if there is no valid manifest.
+    :return: The total uncompressed size of all entries
+    """
+    manifest = load_manifest(path)
+    if manifest is None or manifest.level != level:
+        print('No valid manifest for %s, rebuilding' % path)
+        return write_zip(path, root, names, level, pool)
+
+    old = manifest.entries
+    entries: Dict[str, ManifestEntry] = {name: old[name] for name in names if name in old}  # Unchanged entries
+    changed: Dict[str, ZipEntry] = {}
+    modified = [name for name in names if is_modified(root, name, old.get(name))]
+    for entry in map_bounded(pool, lambda n: read_entry(root, n, level), modified, 4 * (os.cpu_count() or 1)):
+        name = entry.name
+        if name in old and old[name].digest == entry.digest and old[name].method == entry.method:
+            entries[name] = old[name]._replace(mtime_ns=entry.mtime_ns)  # Touched, but the content is the same
+        else:
+            entries.pop(name, None)
+            changed[name] = entry
+
+    removed = len(old.keys() - set(names))
+    if not changed and not removed:
+        if entries != old:
+            save_manifest(path, level, manifest.directory_offset, entries)
+        print('Unchanged %s: %d entries' % (path, len(entries)))
+        return sum(e.size for e in entries.values())
+
+    # Entries which are changed or removed are left in the archive, but are no longer referenced
+    unreferenced = manifest.directory_offset - sum(local_size(n, e) for n, e in entries.items())
+    if unreferenced > COMPACT_RATIO * manifest.directory_offset:
+        mode = 'Compacted'
+        with open(path, 'rb') as src, open(path + '.tmp', 'wb') as f:
+            for name in names:
+                entries[name] = write_entry(f, changed[name], path) if name in changed else copy_entry(src, f, name, entries[name], path)
+            directory_offset = write_central_directory(f, entries, path)
+        os.replace(path + '.tmp', path)
+    else:
+        mode = 'Appended to'
+        with open(path, 'r+b') as f:
+            f.seek(manifest.directory_offset)
+            for name, entry in changed.items():
+                entries[name] = write_entry(f, entry, path)
+            directory_offset = write_central_directory(f, entries, path)
+            f.truncate()
+
+    save_manifest(path, level, directory_offset, entries)
+    print('%s %s: Changed = %d, Removed = %d, Unchanged = %d' % (mode, path, len(changed), removed, len(entries) - len(changed)))
+    return sum(e.size for e in entries.values())
+
+
+def read_entry(root: str, name: str, level: int | None) -> ZipEntry:
+    if name.endswith('/'):
+        return ZipEntry(name, ZIP_STORED, 0, 0, b'', 0, '')
+    with open(os.path.join(root, name), 'rb') as f:
+        mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        data = f.read()
+    crc = zlib.crc32(data)
+    digest = hashlib.sha1(data).hexdigest()
+    if level is None:
+        return ZipEntry(name, ZIP_STORED, crc, len(data), data, mtime_ns, digest)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)  # Raw deflate stream, as used by zip files
+    return ZipEntry(name, ZIP_DEFLATED, crc, len(data), compressor.compress(data) + compressor.flush(), mtime_ns, digest)
+
+
+def is_modified(root: str, name: str, previous: ManifestEntry | None) -> bool:
+    """ If an entry is new, or its source file has a different size or modification time to what it had previously """
+    if previous is None:
+        return True
+    if name.endswith('/'):
+        return False
+    stat = os.stat(os.path.join(root, name))
+    return stat.st_size != previous.size or stat.st_mtime_ns != previous.mtime_ns
+
+
+def write_entry(f: BinaryIO, entry: ZipEntry, path: str) -> ManifestEntry:
+    """ Writes the local header and data of an entry at the current position """
+    offset = f.tell()
+    assert offset < 0xFFFFFFFF, 'Zip file is too large, zip64 is not supported: %s' % path
+    name = entry.name.encode('utf-8')
+    f.write(struct.pack('<IHHHHHIIIHH', 0x04034b50, 20, flags_of(entry.name), entry.method, ZIP_TIME, ZIP_DATE, entry.crc, len(entry.data), entry.size, len(name), 0))
+    f.write(name)
+    f.write(entry.data)
+    return ManifestEntry(entry.size, entry.mtime_ns, entry.digest, entry.method, entry.crc, len(entry.data), offset)
+
+
+def copy_entry(src: BinaryIO, f: BinaryIO, name: str, entry: ManifestEntry, path: str) -> ManifestEntry:
+    """ Copies the local header and data of an entry, byte-for-byte, from another archive to the current position """
+    offset = f.tell()
+    assert offset < 0xFFFFFFFF, 'Zip file is too large, zip64 is not supported: %s' % path
+    src.seek(entry.offset)
+    f.write(src.read(local_size(name, entry)))
+    return entry._replace(offset=offset)
+
+
+def write_central_directory(f: BinaryIO, entries: Dict[str, ManifestEntry], path: str) -> int:
+    """ Writes the central directory, with entries in sorted order, and the end of central directory record, at the current position. Returns the offset of the central directory """
+    assert len(entries) < 0xFFFF, 'Too many entries, zip64 is not supported: %s' % path
+    directory_offset = f.tell()
+    for name, entry in sorted(entries.items()):
+        external_attr = (0o40755 << 16) | 0x10 if name.endswith('/') else 0o100644 << 16
+        encoded = name.encode('utf-8')
+        f.write(struct.pack('<IHHHHHHIIIHHHHHII', 0x02014b50, (3 << 8) | 20, 20, flags_of(name), entry.method, ZIP_TIME, ZIP_DATE, entry.crc, entry.compressed_size, entry.size, len(encoded), 0, 0, 0, 0, external_attr, entry.offset))
+        f.write(encoded)
+    f.write(struct.pack('<IHHHHIIH', 0x06054b50, 0, 0, len(entries), len(entries), f.tell() - directory_offset, directory_offset, 0))
+    return directory_offset
+
+
+def flags_of(name: str) -> int:
+    return 0 if name.isascii() else 0x800  # Bit 11 = UTF-8 name
+
+
+def local_size(name: str, entry: ManifestEntry) -> int:
+    """ The size of the local header and data of an entry """
+    return 30 + len(name.encode('utf-8')) + entry.compressed_size
+
+
+def manifest_path(path: str) -> str:
+    return os.path.join(MANIFEST_DIR, os.path.basename(path) + '.json')
+
+
+def load_manifest(path: str) -> Optional[Manifest]:
+    """ Loads the manifest for an archive, if it exists, and the archive has not been modified since it was written """
+    if not os.path.isfile(path):
+        return None
+    data = json_loader.load_json_cache(manifest_path(path))
+    if data is None:
+        return None
+    try:
+        manifest = Manifest(**{**data, 'entries': {k: ManifestEntry(*v) for k, v in data['entries'].items()}})
+    except (TypeError, KeyError, AttributeError) as e:
+        print('Failed to read zip manifest for %s: %s' % (path, e))
+        return None
+    stat = os.stat(path)
+    if stat.st_size != manifest.archive_size or stat.st_mtime_ns != manifest.archive_mtime_ns:
+        return None
+    return manifest
+
+
+def save_manifest(path: str, level: int | None, directory_offset: int, entries: Dict[str, ManifestEntry]):
+    stat = os.stat(path)
+    json_loader.save_json_cache(manifest_path(path), Manifest(level, stat.st_size, stat.st_mtime_ns, directory_offset, entries)._asdict())
+
+
+def map_bounded(pool: Executor, fn: Callable[[T], R], items: Iterable[T], max_pending: int) -> Iterator[R]:
+    """ Like `pool.map()`, but with at most `max_pending` items submitted at once, so results can be streamed without holding all of them in memory """
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def rescue_asset(path: str):
+    shutil.copy('%s/%s' % (RESOURCES_DIR, path), '%s/%s' % (HOTSWAP_DIR, path))
+
+
+def rescue_folder(path: str):
+    shutil.copytree('%s/%s' % (RESOURCES_DIR, path), '%s/%s' % (HOTSWAP_DIR, path), dirs_exist_ok=True)